@@ -1,14 +1,34 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import hmac
 import json
 import os
+import metrics
+from authdb import AuthDB
+from hashing import PasswordHasher, HasherBusy
 from predictor import TransportationPredictor
 
 app = Flask(__name__)
 CORS(app)
 
-USERS_FILE = "users.json"
-predictor = TransportationPredictor()
+USERS_FILE = os.environ.get("USERS_FILE", "users.json")
+# Users live in SQLite (indexed on email); users.json is only read once, to import it
+USERS_DB = os.environ.get("USERS_DB", "users.sqlite")
+# Imported users.json rows keep their plain-text password behind this marker until their first login
+LEGACY_PLAINTEXT = "plain$"
+hasher = PasswordHasher()
+# Fork the hashing workers while this is the only thread, before the predictor's watcher starts
+hasher.start()
+predictor = TransportationPredictor(
+    use_table=os.environ.get("PREDICT_TABLE") == "1",
+    compact=os.environ.get("ARTIFACTS_FORMAT") == "compact",
+    trees=os.environ.get("ARTIFACTS_FORMAT") == "trees",
+    microbatch_wait_ms=float(os.environ.get("MICROBATCH_WAIT_MS", "0")),
+)
+
+
+users_db = AuthDB(USERS_DB)
+users_db.init_schema()
 
 
 def load_users():
@@ -21,9 +41,51 @@ def load_users():
         return {}
 
 
-def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
+def import_users_json():
+    """
+    One-time move of users.json into USERS_DB; the file is then renamed to
+    users.json.imported so it is not read again. Emails already in the DB
+    are left alone. Hashing every password here would run one KDF per user
+    before the app could start, so the plain-text passwords are stored
+    behind LEGACY_PLAINTEXT and verify_password() hashes each one on that
+    user's first login.
+    """
+    users = load_users()
+    if not users:
+        return 0
+    rows = [
+        (email, LEGACY_PLAINTEXT + user["password"], user.get("name", "User"))
+        for email, user in users.items()
+        if user.get("password")
+    ]
+    inserted = users_db.create_users(rows)
+    os.replace(USERS_FILE, USERS_FILE + ".imported")
+    print(f"Imported {inserted} users from {USERS_FILE} into {USERS_DB}")
+    return inserted
+
+
+def verify_password(email, password_hash, password):
+    """hasher.verify, plus the first login of an imported users.json row"""
+    if not password_hash.startswith(LEGACY_PLAINTEXT):
+        return hasher.verify(email, password_hash, password)
+    if not hmac.compare_digest(password_hash[len(LEGACY_PLAINTEXT):].encode(), password.encode()):
+        return False
+    try:
+        users_db.replace_password_hash(email, password_hash, hasher.hash(password))
+    except HasherBusy:
+        # The login still succeeds; a later one hashes it
+        pass
+    return True
+
+
+def server_busy():
+    response = jsonify({"error": "Server busy, retry"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+import_users_json()
 
 
 @app.route("/api/auth/signup", methods=["POST"])
@@ -36,12 +98,16 @@ def signup():
     if not email or not password:
         return jsonify({"error": "Fields required"}), 400
 
-    users = load_users()
-    if email in users:
+    # Cheap early answer; the INSERT still settles races atomically
+    if users_db.get_user(email):
         return jsonify({"error": "User already exists"}), 400
 
-    users[email] = {"password": password, "name": name}
-    save_users(users)
+    try:
+        password_hash = hasher.hash(password)
+    except HasherBusy:
+        return server_busy()
+    if not users_db.create_user(email, password_hash, name):
+        return jsonify({"error": "User already exists"}), 400
     return jsonify({"success": True, "user": {"email": email, "name": name}})
 
 
@@ -51,13 +117,19 @@ def login():
     email = data.get("email")
     password = data.get("password")
 
-    users = load_users()
-    user = users.get(email)
+    row = users_db.get_user(email) if email and password else None
+    if not row:
+        return jsonify({"error": "Invalid credentials"}), 401
 
-    if not user or user["password"] != password:
+    password_hash, name = row
+    try:
+        verified = verify_password(email, password_hash, password)
+    except HasherBusy:
+        return server_busy()
+    if not verified:
         return jsonify({"error": "Invalid credentials"}), 401
 
-    return jsonify({"success": True, "user": {"email": email, "name": user["name"]}})
+    return jsonify({"success": True, "user": {"email": email, "name": name}})
 
 
 @app.route("/api/predict", methods=["POST"])
@@ -81,6 +153,11 @@ def get_routes():
     return jsonify({"routes": ["R1", "R2", "R3", "R4"]})
 
 
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     print("Starting AI Model Server on port 5000...")
     app.run(debug=True, port=5000)
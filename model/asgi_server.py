@@ -0,0 +1,353 @@
+"""
+ASGI entry point for the prediction API.
+
+Serves the same routes as predict_server.py and returns the same response
+bytes, so the Node proxy in server/index.js works against either. The
+engine, caches, route index, auth DB and hasher are the ones predict_server
+builds. Here the event loop does the request handling and only
+blocking work leaves it:
+
+* inference (engine / micro-batcher) runs on a thread pool. A cached
+  /predict response is answered on the loop directly.
+* SQLite calls run on a small dedicated thread pool. AuthDB keeps one
+  connection per thread, so each of those threads owns one connection.
+* password hashing awaits the hasher's process pool (hash_async /
+  verify_async) without tying up a thread.
+
+    uvicorn asgi_server:app --host 127.0.0.1 --port 5000
+"""
+import asyncio
+import contextlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Route
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+import metrics
+import predict_server
+from predict_server import (
+    ADMIN_RELOAD_SETTLE_SECONDS,
+    ERR_ADMIN_FORBIDDEN,
+    ERR_BAD_CREDENTIALS,
+    ERR_FIELDS_REQUIRED,
+    ERR_SERVER_BUSY,
+    ERR_USER_EXISTS,
+    HOME,
+    ForecastError,
+    admin_allowed,
+    auth_db,
+    batch_error,
+    batch_trips,
+    cached_prediction,
+    compute_prediction,
+    engine,
+    forecast_response,
+    hasher,
+    predict_batch_response,
+    reload_busy,
+    render_json,
+    route_index,
+)
+from route_index import DEFAULT_ROUTES
+from batcher import BatchTimeout
+from registry import ArtifactsChanging
+from hashing import HasherBusy
+from metrics import ERRORS, SERIALIZE
+
+# Threads for inference / SQLite (0 = default sizing)
+INFERENCE_THREADS = int(os.environ.get('ASGI_INFERENCE_THREADS', '0')) or min(8, (os.cpu_count() or 1) + 2)
+DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', '4'))
+
+inference_pool = ThreadPoolExecutor(INFERENCE_THREADS, thread_name_prefix='asgi-inference')
+db_pool = ThreadPoolExecutor(DB_THREADS, thread_name_prefix='asgi-sqlite')
+
+
+async def run_in(pool, fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+def json_response(obj, status_code=200, headers=None):
+    return Response(render_json(obj), status_code=status_code, headers=headers, media_type='application/json')
+
+
+class InvalidJSON(Exception):
+    pass
+
+
+async def read_json(request):
+    """Parsed body, None for an empty body; InvalidJSON if it doesn't parse"""
+    body = await request.body()
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise InvalidJSON()
+
+
+def bad_json():
+    return json_response({'error': 'invalid JSON body'}, 400)
+
+
+def auth_busy():
+    return json_response({'success': False, 'error': ERR_SERVER_BUSY}, 503, {'Retry-After': '1'})
+
+
+async def predict(request):
+    try:
+        payload = await read_json(request) or {}
+    except InvalidJSON:
+        return bad_json()
+
+    try:
+        key, body, featurized = cached_prediction(payload)
+        if body is None:
+            body = await run_in(inference_pool, compute_prediction, payload, key, featurized)
+        return Response(body, media_type='application/json')
+
+    except BatchTimeout as e:
+        print(f"❌ Prediction timeout: {str(e)}")
+        ERRORS.inc('/api/predict', 'timeout')
+        return json_response({'error': str(e)}, 503)
+    except Exception as e:
+        print(f"❌ Prediction error: {str(e)}")
+        ERRORS.inc('/api/predict', 'exception')
+        return json_response({'error': str(e)}, 500)
+
+
+async def predict_batch(request):
+    try:
+        trips = batch_trips(await read_json(request))
+    except InvalidJSON:
+        trips = None
+    error = batch_error(trips)
+    if error is not None:
+        ERRORS.inc('/api/predict/batch', 'bad_request')
+        return json_response({'error': error}, 400)
+
+    try:
+        body = await run_in(inference_pool, predict_batch_response, trips)
+        with SERIALIZE.time():
+            return json_response(body)
+
+    except Exception as e:
+        print(f"❌ Batch prediction error: {str(e)}")
+        ERRORS.inc('/api/predict/batch', 'exception')
+        return json_response({'error': str(e)}, 500)
+
+
+async def forecast(request):
+    if request.method == 'POST':
+        try:
+            payload = await read_json(request) or {}
+        except InvalidJSON:
+            return bad_json()
+    else:
+        payload = dict(request.query_params)
+
+    try:
+        if not isinstance(payload, dict):
+            raise ForecastError('expected a JSON object')
+        body = await run_in(inference_pool, forecast_response, payload)
+        return Response(body, media_type='application/json')
+
+    except ForecastError as e:
+        ERRORS.inc('/api/forecast', 'bad_request')
+        return json_response({'error': str(e)}, 400)
+    except Exception as e:
+        print(f"❌ Forecast error: {str(e)}")
+        ERRORS.inc('/api/forecast', 'exception')
+        return json_response({'error': str(e)}, 500)
+
+
+async def credentials(request):
+    payload = await read_json(request)
+    return payload if isinstance(payload, dict) else {}
+
+
+async def auth_signup(request):
+    try:
+        payload = await credentials(request)
+    except InvalidJSON:
+        return bad_json()
+    email = payload.get('email')
+    password = payload.get('password')
+    name = payload.get('name') or ''
+
+    if not email or not password:
+        return json_response({'success': False, 'error': ERR_FIELDS_REQUIRED})
+
+    if await run_in(db_pool, auth_db.get_user, email):
+        return json_response({'success': False, 'error': ERR_USER_EXISTS})
+
+    try:
+        ph = await hasher.hash_async(password)
+    except HasherBusy:
+        ERRORS.inc('/api/auth/signup', 'busy')
+        return auth_busy()
+    if not await run_in(db_pool, auth_db.create_user, email, ph, name):
+        return json_response({'success': False, 'error': ERR_USER_EXISTS})
+
+    return json_response({'success': True, 'user': {'email': email, 'name': name}})
+
+
+async def auth_login(request):
+    try:
+        payload = await credentials(request)
+    except InvalidJSON:
+        return bad_json()
+    email = payload.get('email')
+    password = payload.get('password')
+
+    if not email or not password:
+        return json_response({'success': False, 'error': ERR_FIELDS_REQUIRED})
+
+    row = await run_in(db_pool, auth_db.get_user, email)
+
+    if not row:
+        return json_response({'success': False, 'error': ERR_BAD_CREDENTIALS})
+
+    ph, name = row
+    try:
+        verified = await hasher.verify_async(email, ph, password)
+    except HasherBusy:
+        ERRORS.inc('/api/auth/login', 'busy')
+        return auth_busy()
+    if not verified:
+        return json_response({'success': False, 'error': ERR_BAD_CREDENTIALS})
+
+    return json_response({'success': True, 'user': {'email': email, 'name': name or ''}})
+
+
+def not_modified(request, routes):
+    # Same rules as werkzeug's make_conditional: If-None-Match wins over If-Modified-Since
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        return parse_etags(if_none_match).contains_weak(routes.etag)
+    since = parse_date(request.headers.get('if-modified-since'))
+    if since is not None and routes.last_modified is not None:
+        return routes.last_modified.replace(microsecond=0) <= since
+    return False
+
+
+async def api_routes(request):
+    try:
+        # Only rebuilds (reads the CSV) when its source changed
+        routes = await run_in(inference_pool, route_index.get)
+    except Exception as e:
+        print(f"❌ Error reading routes: {str(e)}")
+        ERRORS.inc('/api/routes', 'exception')
+        return json_response({'routes': DEFAULT_ROUTES})
+
+    headers = {'ETag': quote_etag(routes.etag), 'Cache-Control': 'no-cache'}
+    if routes.last_modified is not None:
+        headers['Last-Modified'] = http_date(routes.last_modified)
+    if not_modified(request, routes):
+        return Response(status_code=304, headers=headers)
+    return json_response({'routes': routes.routes}, headers=headers)
+
+
+def admin_forbidden(request):
+    """403 response unless the request carries ADMIN_TOKEN, see predict_server.admin_allowed"""
+    if admin_allowed(request.headers.get('authorization')):
+        return None
+    return json_response({'error': ERR_ADMIN_FORBIDDEN}, 403)
+
+
+async def admin_model(request):
+    forbidden = admin_forbidden(request)
+    if forbidden is not None:
+        return forbidden
+    return json_response(engine.registry.status())
+
+
+async def admin_stats(request):
+    forbidden = admin_forbidden(request)
+    if forbidden is not None:
+        return forbidden
+    batcher = predict_server.batcher
+    return json_response({
+        'model': engine.registry.status(),
+        'batcher': batcher.stats() if batcher is not None else None,
+        'hasher': hasher.stats(),
+        'response_cache': predict_server.response_cache.stats(),
+    })
+
+
+async def admin_model_reload(request):
+    forbidden = admin_forbidden(request)
+    if forbidden is not None:
+        return forbidden
+    try:
+        await run_in(inference_pool, engine.reload, ADMIN_RELOAD_SETTLE_SECONDS)
+    except ArtifactsChanging as e:
+        return json_response(*reload_busy(e))
+    except Exception as e:
+        print(f"❌ Reload error: {str(e)}")
+        ERRORS.inc('/api/admin/model/reload', 'exception')
+        return json_response({'error': str(e), **engine.registry.status()}, 500)
+    return json_response(engine.registry.status())
+
+
+async def prometheus_metrics(request):
+    return Response(metrics.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+async def home(request):
+    return json_response(HOME)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    inference_pool.shutdown(wait=False)
+    db_pool.shutdown(wait=False)
+    hasher.shutdown()
+
+
+routes = [
+    Route('/predict', predict, methods=['POST']),
+    Route('/api/predict', predict, methods=['POST']),
+    Route('/predict/batch', predict_batch, methods=['POST']),
+    Route('/api/predict/batch', predict_batch, methods=['POST']),
+    Route('/forecast', forecast, methods=['GET', 'POST']),
+    Route('/api/forecast', forecast, methods=['GET', 'POST']),
+    Route('/auth/signup', auth_signup, methods=['POST']),
+    Route('/api/auth/signup', auth_signup, methods=['POST']),
+    Route('/auth/login', auth_login, methods=['POST']),
+    Route('/api/auth/login', auth_login, methods=['POST']),
+    Route('/routes', api_routes, methods=['GET']),
+    Route('/api/routes', api_routes, methods=['GET']),
+    Route('/admin/model', admin_model, methods=['GET']),
+    Route('/api/admin/model', admin_model, methods=['GET']),
+    Route('/admin/stats', admin_stats, methods=['GET']),
+    Route('/api/admin/stats', admin_stats, methods=['GET']),
+    Route('/admin/model/reload', admin_model_reload, methods=['POST']),
+    Route('/api/admin/model/reload', admin_model_reload, methods=['POST']),
+    Route('/metrics', prometheus_metrics, methods=['GET']),
+    Route('/', home, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("=" * 50)
+    print("🚀 Starting Transport Delay Prediction Server (ASGI)")
+    print("=" * 50)
+    print("📍 Server: http://127.0.0.1:5000")
+    print("=" * 50)
+
+    uvicorn.run(app, host='127.0.0.1', port=5000, timeout_keep_alive=30)
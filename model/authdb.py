@@ -0,0 +1,121 @@
+"""
+SQLite access for the auth endpoints.
+
+Each thread keeps one open connection (WAL journal, tuned pragmas) instead of
+connecting per request. WAL lets logins read while a signup writes, and the
+sqlite3 module caches the prepared statements per connection. Signup is a
+single INSERT ... ON CONFLICT, so two concurrent signups for the same email
+cannot both succeed.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import AUTH_DB
+
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    password_hash TEXT,
+    name TEXT
+)"""
+
+INSERT_USER = (
+    "INSERT INTO users(email,password_hash,name) VALUES(?,?,?) "
+    "ON CONFLICT(email) DO NOTHING"
+)
+SELECT_USER = "SELECT password_hash,name FROM users WHERE email=?"
+# Compare-and-set: a concurrent change of the same row wins
+UPDATE_PASSWORD_HASH = "UPDATE users SET password_hash=? WHERE email=? AND password_hash=?"
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    # Durable at checkpoints, no fsync per commit (safe with WAL)
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA mmap_size=67108864",
+]
+
+
+class AuthDB:
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def connection(self):
+        """This thread's connection, opened on first use"""
+        if self._pid != os.getpid():
+            # Connections must not be shared with a forked child
+            self._local = threading.local()
+            self._connections = []
+            self._pid = os.getpid()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=32,
+            )
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def init_schema(self):
+        self.connection().execute(SCHEMA)
+
+    def create_user(self, email, password_hash, name):
+        """True if the user was created, False if the email is already taken"""
+        start = time.perf_counter()
+        try:
+            cur = self.connection().execute(INSERT_USER, (email, password_hash, name))
+            return cur.rowcount == 1
+        finally:
+            AUTH_DB.observe(time.perf_counter() - start)
+
+    def create_users(self, rows):
+        """Bulk insert of (email, password_hash, name) in one transaction -> rows inserted"""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            inserted = conn.executemany(INSERT_USER, rows).rowcount
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return inserted
+
+    def replace_password_hash(self, email, old_hash, new_hash):
+        """True if email's hash was still old_hash and is now new_hash"""
+        start = time.perf_counter()
+        try:
+            cur = self.connection().execute(UPDATE_PASSWORD_HASH, (new_hash, email, old_hash))
+            return cur.rowcount == 1
+        finally:
+            AUTH_DB.observe(time.perf_counter() - start)
+
+    def get_user(self, email):
+        """(password_hash, name) or None"""
+        start = time.perf_counter()
+        try:
+            return self.connection().execute(SELECT_USER, (email,)).fetchone()
+        finally:
+            AUTH_DB.observe(time.perf_counter() - start)
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
@@ -0,0 +1,112 @@
+"""
+Dynamic micro-batching for concurrent single-trip predictions.
+
+Request threads submit() one item and block. A single scheduler thread takes
+the first waiting item, keeps collecting for up to max_wait seconds or until
+max_batch items, runs predict_fn once on the whole list, and hands each
+result back to its caller. Ensemble inference cost is mostly fixed per call,
+so under concurrency N requests pay for one call instead of N.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+class BatchTimeout(Exception):
+    """The request waited longer than its timeout for a batch slot/result"""
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch=64, max_wait=0.002, timeout=1.0, name="micro-batcher"):
+        # predict_fn: list of items -> list of results in the same order
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.max_batch_seen = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.name = name
+        self._thread = None
+        self._pid = None
+
+    def _ensure_running(self):
+        # Started lazily, and again in a forked worker where the thread is gone
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None:
+                if self._pid is not None and self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item, timeout=None):
+        """Blocks until the item's batch ran; raises BatchTimeout or predict_fn's error"""
+        self._ensure_running()
+        future = Future()
+        self._queue.put((item, future))
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            # Still queued: the scheduler will skip it. Already running: result is dropped.
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise BatchTimeout(f"prediction not ready after {self.timeout if timeout is None else timeout}s")
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [(item, f) for item, f in self._collect() if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.predict_fn([item for item, _ in batch])
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            with self._lock:
+                self.batches += 1
+                self.rows += len(batch)
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self.batches,
+                "rows": self.rows,
+                "mean_batch_size": round(self.rows / self.batches, 2) if self.batches else 0,
+                "max_batch_size": self.max_batch_seen,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+            }
@@ -0,0 +1,308 @@
+"""
+Latency / throughput benchmarks for the serving stack.
+
+Covers featurization, TransportationPredictor.predict, the raw model call
+at batch sizes from 1 to 100k rows (for each artifact format present), and
+the Flask endpoints through their test clients. Inputs are synthetic trips
+that follow the schema of the training CSV, including some unknown routes
+and weathers. Every case reports p50/p95/p99 latency and rows/s, and the
+whole run is written as JSON.
+
+    python benchmark.py [--out benchmark.json] [--baseline old.json] [--quick]
+    python benchmark.py --write-csv synthetic.csv --rows 1000000
+
+With --baseline, cases that got slower than --threshold (p50 latency up or
+rows/s down) are listed and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000, 100000]
+ROUTES = ["R1", "R2", "R3", "R4", "r2 ", "R9"]
+WEATHERS = ["sunny", "cloudy", "rainy", "foggy", "Rainy ", "snow"]
+DAY_TYPES = ["weekday", "weekend"]
+TIME_CATEGORIES = ["morning", "afternoon", "evening", "night"]
+
+
+def synthetic_frame(n_rows, seed=42):
+    """DataFrame with the columns of cleaned_transport_data (2).csv"""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2024-01-01T00:00")
+    scheduled = start + rng.integers(0, 365 * 24 * 60, n_rows).astype("timedelta64[m]")
+    delays = np.clip(rng.gamma(2.0, 4.0, n_rows).round(), 0, None).astype(np.int64)
+    hours = ((scheduled - scheduled.astype("datetime64[D]")).astype("timedelta64[h]")).astype(np.int64)
+    weather_idx = rng.integers(0, 4, n_rows)
+    return pd.DataFrame(
+        {
+            "route_id": rng.choice(ROUTES[:4], n_rows),
+            "scheduled_time": pd.to_datetime(scheduled).strftime("%Y-%m-%d %H:%M:%S"),
+            "actual_time": pd.to_datetime(scheduled + delays.astype("timedelta64[m]")).strftime("%Y-%m-%d %H:%M:%S"),
+            "weather": np.array(WEATHERS[:4])[weather_idx],
+            "passenger_count": rng.integers(10, 300, n_rows),
+            "latitude": 24.5 + rng.random(n_rows) * 0.2,
+            "longitude": 32.5 + rng.random(n_rows) * 0.2,
+            "delay_minutes": delays,
+            "time_category": np.array(TIME_CATEGORIES)[hours // 6],
+            "day_type": rng.choice(DAY_TYPES, n_rows),
+            "weather_severity": weather_idx + 1,
+            "is_peak_hour": (((hours >= 7) & (hours <= 9)) | ((hours >= 16) & (hours <= 19))).astype(np.int64),
+            "route_frequency": rng.integers(10, 200, n_rows),
+            "hour_of_day": hours,
+        }
+    )
+
+
+def synthetic_trips(n, seed=42):
+    """Request payloads as the frontend sends them, a few with unknown labels"""
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "route_id": str(rng.choice(ROUTES)),
+            "scheduled_time": f"{int(rng.integers(0, 24)):02d}:{int(rng.integers(0, 60)):02d}",
+            "weather": str(rng.choice(WEATHERS)),
+            "day_type": str(rng.choice(DAY_TYPES)),
+        }
+        for _ in range(n)
+    ]
+
+
+def measure(fn, rows_per_call=1, repeat=200, budget_s=2.0, warmup=3, expect_status=None):
+    """
+    Call fn until repeat samples or budget_s seconds (at least 5 samples),
+    -> latency percentiles in ms and rows/s over the timed calls.
+    With expect_status, fn returns a response and any other status fails the
+    run, so a broken route can't pass as a fast one.
+    """
+
+    def call():
+        result = fn()
+        if expect_status is not None and result.status_code != expect_status:
+            raise RuntimeError(f"expected HTTP {expect_status}, got {result.status_code}")
+
+    for _ in range(warmup):
+        call()
+    samples = []
+    deadline = time.perf_counter() + budget_s
+    while len(samples) < repeat and (len(samples) < 5 or time.perf_counter() < deadline):
+        start = time.perf_counter_ns()
+        call()
+        samples.append(time.perf_counter_ns() - start)
+
+    ms = np.array(samples) / 1e6
+    return {
+        "calls": len(samples),
+        "rows_per_call": rows_per_call,
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+        "rows_per_s": round(rows_per_call * len(ms) / (ms.sum() / 1000), 1),
+    }
+
+
+def cycle(items):
+    """fn() that hands out the next item on each call, to vary inputs between samples"""
+    state = {"i": 0}
+
+    def next_item():
+        item = items[state["i"] % len(items)]
+        state["i"] += 1
+        return item
+
+    return next_item
+
+
+def bench_featurize(engine, trips, results, args):
+    trip = cycle(trips)
+    results["featurize.single"] = measure(lambda: engine.featurize(trip()), repeat=args.repeat)
+    for size in (100, 10000):
+        batch = trips[:size]
+        results[f"featurize.batch.{size}"] = measure(
+            lambda: engine.featurize_batch(batch), rows_per_call=size, repeat=args.repeat
+        )
+
+
+def bench_model(engine, trips, results, args, label):
+    """predict_delays() as the servers call it: the table when one is built, else the model"""
+    artifacts = engine.artifacts
+    if artifacts.model is None:
+        print(f"⚠️ {label}: no model loaded, skipping predict_delays")
+        return
+    features, _, is_peak, weathers = engine.featurize_batch(trips)
+    weathers = np.asarray(weathers, dtype=object)
+    for size in args.batch_sizes:
+        if size > len(features):
+            reps = size // len(features) + 1
+            features = np.tile(features, (reps, 1))
+            is_peak = np.tile(is_peak, reps)
+            weathers = np.tile(weathers, reps)
+        batch = np.ascontiguousarray(features[:size])
+        batch_peak, batch_weathers = is_peak[:size], weathers[:size]
+        results[f"model.{label}.{size}"] = measure(
+            lambda: engine.predict_delays(batch, batch_peak, batch_weathers, artifacts),
+            rows_per_call=size,
+            repeat=args.repeat,
+        )
+
+
+def bench_predictor(trips, results, args):
+    from predictor import TransportationPredictor
+
+    predictor = TransportationPredictor(artifacts_dir=args.artifacts_dir)
+    predictor.engine.registry.stop()
+    trip = cycle(trips)
+
+    def call():
+        t = trip()
+        predictor.predict(t["route_id"], t["scheduled_time"], t["weather"], t["day_type"])
+
+    results["predictor.predict"] = measure(call, repeat=args.repeat)
+
+
+def bench_endpoints(trips, results, args):
+    # The servers read AUTH_DB / USERS_DB / ARTIFACTS_* at import time, see __main__
+    import predict_server
+
+    client = predict_server.app.test_client()
+    trip = cycle(trips)
+    results["endpoint.predict_server./api/predict"] = measure(
+        lambda: client.post("/api/predict", json=trip()), repeat=args.repeat, expect_status=200
+    )
+    batch = trips[:100]
+    results["endpoint.predict_server./api/predict/batch.100"] = measure(
+        lambda: client.post("/api/predict/batch", json=batch),
+        rows_per_call=len(batch),
+        repeat=args.repeat,
+        expect_status=200,
+    )
+    results["endpoint.predict_server./api/routes"] = measure(
+        lambda: client.get("/api/routes"), repeat=args.repeat, expect_status=200
+    )
+
+    import app as flask_app
+
+    client = flask_app.app.test_client()
+    results["endpoint.app./api/predict"] = measure(
+        lambda: client.post("/api/predict", json=trip()), repeat=args.repeat, expect_status=200
+    )
+
+
+def run(args):
+    from compact import COMPACT_FILE
+    from inference import InferenceEngine
+    from trees import TREES_FILE
+
+    trips = synthetic_trips(10000)
+    results = {}
+
+    engine = InferenceEngine(args.artifacts_dir, poll_interval=0)
+    version = engine.artifacts.version
+    bench_featurize(engine, trips, results, args)
+
+    formats = {
+        "pickle": {},
+        "table": {"use_table": True},
+        "compact": {"compact": True},
+        "trees": {"trees": True},
+    }
+    files = {"compact": COMPACT_FILE, "trees": TREES_FILE}
+    for label in args.formats:
+        if label in files and not os.path.exists(os.path.join(args.artifacts_dir, files[label])):
+            print(f"⚠️ {files[label]} not found in {args.artifacts_dir}, skipping {label}")
+            continue
+        bench_model(InferenceEngine(args.artifacts_dir, poll_interval=0, **formats[label]), trips, results, args, label)
+
+    bench_predictor(trips, results, args)
+    if not args.skip_endpoints:
+        bench_endpoints(trips, results, args)
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "artifacts_dir": args.artifacts_dir,
+            "artifacts_version": version,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """-> list of (case, metric, baseline, current, change) that regressed beyond threshold"""
+    regressions = []
+    for case, now in current["results"].items():
+        before = baseline.get("results", {}).get(case)
+        if before is None:
+            continue
+        p50_change = now["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        rate_change = now["rows_per_s"] / before["rows_per_s"] - 1 if before["rows_per_s"] else 0.0
+        print(f"{case:55s} p50 {before['p50_ms']:>9.3f} -> {now['p50_ms']:>9.3f} ms ({p50_change:+.1%})")
+        if p50_change > threshold:
+            regressions.append((case, "p50_ms", before["p50_ms"], now["p50_ms"], p50_change))
+        if rate_change < -threshold:
+            regressions.append((case, "rows_per_s", before["rows_per_s"], now["rows_per_s"], rate_change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--artifacts-dir", help="default: $ARTIFACTS_DIR or ./artifacts")
+    parser.add_argument("--formats", default="pickle,table,compact,trees", help="model formats to time")
+    parser.add_argument("--batch-sizes", default=",".join(map(str, BATCH_SIZES)))
+    parser.add_argument("--repeat", type=int, default=200, help="max timed calls per case")
+    parser.add_argument("--quick", action="store_true", help="fewer calls and batch sizes up to 1000")
+    parser.add_argument("--skip-endpoints", action="store_true")
+    parser.add_argument("--out", default="benchmark.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before failing")
+    parser.add_argument("--write-csv", metavar="PATH", help="only write a synthetic training CSV")
+    parser.add_argument("--rows", type=int, default=100000, help="rows for --write-csv")
+    args = parser.parse_args()
+
+    if args.write_csv:
+        synthetic_frame(args.rows).to_csv(args.write_csv, index=False)
+        print(f"Wrote {args.rows} synthetic rows to {args.write_csv}")
+        sys.exit(0)
+
+    # Before anything imports registry.py / the servers, which read these once
+    if args.artifacts_dir:
+        os.environ["ARTIFACTS_DIR"] = args.artifacts_dir
+    # Keep the servers' user stores out of the cwd (app.py would also import a users.json found there)
+    scratch = tempfile.mkdtemp(prefix="bench-")
+    os.environ.setdefault("AUTH_DB", os.path.join(scratch, "auth.sqlite"))
+    os.environ.setdefault("USERS_DB", os.path.join(scratch, "users.sqlite"))
+    os.environ.setdefault("USERS_FILE", os.path.join(scratch, "users.json"))
+    os.environ.setdefault("ARTIFACTS_POLL_SECONDS", "0")
+    from registry import ARTIFACTS_DIR
+
+    args.artifacts_dir = ARTIFACTS_DIR
+    args.formats = [f for f in args.formats.split(",") if f]
+    args.batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    if args.quick:
+        args.repeat = min(args.repeat, 30)
+        args.batch_sizes = [b for b in args.batch_sizes if b <= 1000]
+
+    report = run(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for case, metric, before, now, change in regressions:
+            print(f"❌ {case} {metric}: {before} -> {now} ({change:+.1%})")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,181 @@
+"""
+Compact, NumPy-only export of the trained artifacts.
+
+The serving features are a closed domain (24 hours x weather classes x route
+classes, is_peak derived from the hour), so the model is exported as its
+prediction table together with the encoders' classes_ in a single .npz.
+Loading it needs only NumPy: no joblib/pickle, sklearn, xgboost or pandas.
+
+    python compact.py [artifacts_dir]
+"""
+import contextlib
+import os
+import struct
+import sys
+import zipfile
+
+import numpy as np
+
+
+COMPACT_FILE = "compact.npz"
+
+
+class CompactModel:
+    """Stand-in for the trained model, answering predict() from the exported table"""
+
+    def __init__(self, values, model_name=None):
+        self.values = values
+        self.model_name = model_name
+        self.n_features_in_ = 4
+
+    def predict(self, features):
+        """
+        Rows are [hour, is_peak, weather_code, route_code]. Hours outside
+        0-23 are clamped to the trained range (the trees never saw them).
+        """
+        features = np.asarray(features)
+        n_hour, n_weather, n_route = self.values.shape[:3]
+        hours = np.clip(features[:, 0].astype(np.int64), 0, n_hour - 1)
+        weather_codes = np.clip(features[:, 2].astype(np.int64), 0, n_weather - 1)
+        route_codes = np.clip(features[:, 3].astype(np.int64), 0, n_route - 1)
+        return self.values[hours, weather_codes, route_codes]
+
+
+def export_compact(artifacts_dir, out_path=None):
+    """Score the full feature domain with model.pkl and write compact.npz next to it"""
+    from prediction_table import PredictionTable
+    from registry import load_artifacts
+
+    artifacts = load_artifacts(artifacts_dir)
+    if artifacts.model is None or artifacts.le_route is None or artifacts.le_weather is None:
+        raise FileNotFoundError(f"model.pkl and both encoders are required in {artifacts_dir}")
+
+    n_weather, n_route = len(artifacts.weather_encoder), len(artifacts.route_encoder)
+    table = PredictionTable(artifacts.model, n_weather, n_route)
+    # Interval bounds over the same domain, when the model has them (uncertainty.py)
+    extra = {}
+    if artifacts.interval is not None:
+        extra["interval"] = PredictionTable(artifacts.interval, n_weather, n_route).values
+    extra.update(calibration_arrays(artifacts.confidence_calibration))
+    out_path = out_path or os.path.join(artifacts_dir, COMPACT_FILE)
+    with atomic_write(out_path) as f:
+        np.savez(
+            f,
+            table=table.values,
+            route_classes=artifacts.route_encoder.classes_,
+            weather_classes=artifacts.weather_encoder.classes_,
+            feature_cols=np.asarray(artifacts.metadata.get("feature_cols", []), dtype=str),
+            model_name=np.asarray(artifacts.metadata.get("model_name", ""), dtype=str),
+            source_version=np.asarray(artifacts.version or "", dtype=str),
+            **extra,
+        )
+    return out_path
+
+
+@contextlib.contextmanager
+def atomic_write(path):
+    """
+    Binary file handle whose contents replace path in one rename when the
+    block exits cleanly. Readers see the old file or the new one, never a
+    partial write, and workers that memory-mapped the old file keep their
+    mapping.
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_npz(path, mmap=False):
+    """
+    Read every array of an .npz. With mmap=True the uncompressed members
+    (np.savez never compresses) are memory-mapped read-only straight out of
+    the zip, so processes loading the same file share one copy in the page
+    cache instead of each holding a private one.
+    """
+    if not mmap:
+        with np.load(path, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.lib.format.read_array(zf.open(info), allow_pickle=False)
+                continue
+
+            # Local file header: 30 fixed bytes, then the file name and extra field
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+            if dtype.hasobject:
+                raise ValueError(f"{path}:{name} holds Python objects and cannot be memory-mapped")
+            if not shape or 0 in shape:
+                # Scalars and empty arrays are not worth a mapping
+                arrays[name] = np.lib.format.read_array(zf.open(info), allow_pickle=False)
+                continue
+            arrays[name] = np.memmap(
+                path,
+                dtype=dtype,
+                mode="r",
+                offset=f.tell(),
+                shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return arrays
+
+
+def calibration_arrays(calibration):
+    """metadata["confidence_calibration"] as .npz members (none when there is no calibration)"""
+    if calibration is None:
+        return {}
+    return {
+        "confidence_scores": np.asarray(calibration["scores"], dtype=np.float64),
+        "confidence_rates": np.asarray(calibration["rates"], dtype=np.float64),
+    }
+
+
+def calibration_metadata(data):
+    """calibration_arrays() read back into metadata form"""
+    if "confidence_scores" not in data:
+        return {}
+    return {
+        "confidence_calibration": {
+            "scores": data["confidence_scores"].tolist(),
+            "rates": data["confidence_rates"].tolist(),
+        }
+    }
+
+
+def load_compact(path, mmap=False):
+    """-> (CompactModel, route_classes, weather_classes, metadata, interval CompactModel or None)"""
+    data = load_npz(path, mmap=mmap)
+    model_name = str(data["model_name"])
+    metadata = {
+        "model_name": model_name,
+        "feature_cols": data["feature_cols"].tolist(),
+        "source_version": str(data["source_version"]),
+        "format": "compact",
+    }
+    metadata.update(calibration_metadata(data))
+    model = CompactModel(data["table"], model_name)
+    interval = CompactModel(data["interval"], model_name) if "interval" in data else None
+    return model, data["route_classes"], data["weather_classes"], metadata, interval
+
+
+if __name__ == "__main__":
+    from registry import ARTIFACTS_DIR
+
+    path = export_compact(sys.argv[1] if len(sys.argv) > 1 else ARTIFACTS_DIR)
+    print(f"Compact artifacts written to {path}")
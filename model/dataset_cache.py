@@ -0,0 +1,70 @@
+"""
+On-disk cache of the encoded training data.
+
+Parsing the CSV (dates, string normalization, label fitting) is most of a
+training run's wall time, and the result only changes when the CSV or the
+feature rules change. The cleaned feature matrix, target and encoder classes
+are written to an uncompressed .npz keyed by the source file's sha256 and
+the feature spec, and later runs memory-map it through compact.load_npz.
+"""
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from compact import atomic_write, load_npz
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(csv_path, spec):
+    """Content hash of the source plus the spec (a JSON-able dict) it was encoded with"""
+    digest = hashlib.sha256(file_sha256(csv_path).encode())
+    digest.update(json.dumps(spec, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def _prefix(csv_path):
+    # One entry per source file name; older keys for it are replaced
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", stem) + "-"
+
+
+def cache_path(cache_dir, csv_path, key):
+    return os.path.join(cache_dir, f"{_prefix(csv_path)}{key}.npz")
+
+
+def load_cached(cache_dir, csv_path, key, mmap=True):
+    """(X, y, route_classes, weather_classes) or None when there is no entry for key"""
+    path = cache_path(cache_dir, csv_path, key)
+    if not os.path.exists(path):
+        return None
+    data = load_npz(path, mmap=mmap)
+    return data["X"], data["y"], data["route_classes"], data["weather_classes"]
+
+
+def save_cache(cache_dir, csv_path, key, X, y, route_classes, weather_classes):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, csv_path, key)
+    with atomic_write(path) as f:
+        np.savez(
+            f,
+            X=X,
+            y=y,
+            route_classes=np.asarray(route_classes, dtype=str),
+            weather_classes=np.asarray(weather_classes, dtype=str),
+        )
+
+    prefix = _prefix(csv_path)
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name.endswith(".npz") and os.path.join(cache_dir, name) != path:
+            os.remove(os.path.join(cache_dir, name))
+    return path
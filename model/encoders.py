@@ -0,0 +1,59 @@
+import numpy as np
+
+
+# Code returned for labels the encoder never saw during training
+UNKNOWN = -1
+
+
+class FastLabelEncoder:
+    """
+    Lookup-table replacement for LabelEncoder.transform at serving time.
+
+    Built once from a fitted encoder's classes_, it skips sklearn's input
+    validation: encode() is a dict lookup for single labels and transform()
+    is one searchsorted over a whole array of strings. Unknown labels map to
+    unknown_code instead of raising. Codes are the positions in classes_, so
+    they match the fitted encoder even if classes_ is not sorted.
+    """
+
+    def __init__(self, classes, unknown_code=UNKNOWN):
+        self.classes_ = np.asarray(classes).astype(str)
+        self.unknown_code = unknown_code
+        self.index = {label: code for code, label in enumerate(self.classes_.tolist())}
+        self._sorter = np.argsort(self.classes_, kind="stable")
+        self._sorted = self.classes_[self._sorter]
+
+    @classmethod
+    def from_label_encoder(cls, encoder, unknown_code=UNKNOWN):
+        return cls(encoder.classes_, unknown_code=unknown_code)
+
+    def __len__(self):
+        return len(self.classes_)
+
+    def __contains__(self, label):
+        return label in self.index
+
+    def encode(self, label):
+        """Scalar path: one label -> int code"""
+        return self.index.get(label, self.unknown_code)
+
+    def known(self, labels):
+        """Boolean mask of the labels present in classes_"""
+        labels = np.asarray(labels).astype(str)
+        if not len(self._sorted):
+            return np.zeros(labels.shape, dtype=bool)
+        pos = np.searchsorted(self._sorted, labels)
+        pos[pos == len(self._sorted)] = 0
+        return self._sorted[pos] == labels
+
+    def transform(self, labels):
+        """Vectorized path: array of labels -> int64 array of codes"""
+        labels = np.asarray(labels).astype(str)
+        codes = np.full(labels.shape, self.unknown_code, dtype=np.int64)
+        if not len(self._sorted) or not labels.size:
+            return codes
+        pos = np.searchsorted(self._sorted, labels)
+        pos[pos == len(self._sorted)] = 0
+        match = self._sorted[pos] == labels
+        codes[match] = self._sorter[pos[match]]
+        return codes
@@ -0,0 +1,25 @@
+# Pre-forking deployment of predict_server.py:
+#
+#     gunicorn -c gunicorn.conf.py predict_server:app
+#
+# The app (and with it the model) is imported once in the master before the
+# workers are forked, so they share its memory copy-on-write. Add
+# ARTIFACTS_FORMAT=compact and/or MMAP_ARTIFACTS=1 to keep the artifact arrays
+# in file-backed, read-only pages that stay shared after a hot reload as well.
+import os
+
+bind = os.environ.get("BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "4"))
+preload_app = True
+
+
+def when_ready(server):
+    import predict_server
+
+    predict_server.preload()
+
+
+def post_fork(server, worker):
+    import predict_server
+
+    predict_server.post_fork()
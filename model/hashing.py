@@ -0,0 +1,181 @@
+"""
+Password hashing off the request threads.
+
+generate_password_hash / check_password_hash are deliberately slow KDFs. Run
+inline they hold the GIL for long stretches and starve /predict in the same
+process, so they run in a small process pool instead. Admission is bounded:
+when max_pending hashes are already queued or running, new ones fail fast
+with HasherBusy (the endpoints answer 503) instead of queueing without limit.
+
+Successful verifications are remembered for a short time so a user logging
+in again skips the KDF. Entries are keyed on the email, the stored hash (a
+password change invalidates them) and an HMAC of the password under a
+per-process random key. Failed verifications are never cached, so guessing
+passwords always costs a full KDF run.
+
+hash_async / verify_async are the same operations for the ASGI server: the
+event loop awaits the pool future instead of parking a thread on it.
+"""
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import HASHING
+from response_cache import ResponseCache
+
+
+class HasherBusy(Exception):
+    """The hashing pool is saturated; the caller should retry later"""
+
+
+class VerifiedCache(ResponseCache):
+    """The TTL + LRU cache of response_cache.py, holding recently verified credentials"""
+
+    def __init__(self, max_size=1024, ttl=300.0):
+        super().__init__(max_size, ttl)
+        self._key = secrets.token_bytes(32)
+
+    def _cache_key(self, email, password_hash, password):
+        tag = hmac.new(self._key, password.encode(), hashlib.sha256).digest()
+        return (email, password_hash, tag)
+
+    def get(self, email, password_hash, password):
+        if not self.enabled:
+            return False
+        return super().get(self._cache_key(email, password_hash, password)) is not None
+
+    def put(self, email, password_hash, password):
+        super().put(self._cache_key(email, password_hash, password), True)
+
+
+def _pool_context():
+    # fork: workers only run werkzeug's KDF, and spawn/forkserver would
+    # re-import the server's __main__ (loading the model) in every worker.
+    # Forking is only safe while the process has one thread, see start()
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+class PasswordHasher:
+    def __init__(self, max_workers=None, max_pending=None, timeout=10.0, cache_size=1024, cache_ttl=300.0):
+        # Leave most cores to inference
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.max_pending = max_pending or self.max_workers * 4
+        self.timeout = timeout
+        self.cache = VerifiedCache(cache_size, cache_ttl)
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # The parent's pool and locks are unusable in a forked child (gunicorn workers)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        """
+        Fork the pool workers now. Call it at startup before any thread
+        exists (watcher, batcher, request threads, OpenMP): forking a
+        multi-threaded process can leave the child holding locks that no
+        thread will ever release. Under gunicorn, call it again in post_fork.
+        """
+        self._pool().submit(os.getpid).result()
+
+    def _after_fork(self):
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _pool(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=_pool_context()
+                    )
+        return self._executor
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy("password hashing queue is full")
+        try:
+            future = self._pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, fn, *args):
+        start = time.perf_counter()
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise HasherBusy("password hashing timed out")
+        finally:
+            # Queue wait included; rejected submissions never get here
+            HASHING.observe(time.perf_counter() - start)
+
+    async def _run_async(self, fn, *args):
+        # Same admission control, awaited on the event loop instead of a thread
+        start = time.perf_counter()
+        future = self._submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise HasherBusy("password hashing timed out")
+        finally:
+            HASHING.observe(time.perf_counter() - start)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password)
+
+    def verify(self, email, password_hash, password):
+        if not password_hash:
+            return False
+        if self.cache.get(email, password_hash, password):
+            return True
+        ok = self._run(check_password_hash, password_hash, password)
+        if ok:
+            self.cache.put(email, password_hash, password)
+        return ok
+
+    async def hash_async(self, password):
+        return await self._run_async(generate_password_hash, password)
+
+    async def verify_async(self, email, password_hash, password):
+        if not password_hash:
+            return False
+        if self.cache.get(email, password_hash, password):
+            return True
+        ok = await self._run_async(check_password_hash, password_hash, password)
+        if ok:
+            self.cache.put(email, password_hash, password)
+        return ok
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,298 @@
+"""
+Inference core shared by predict_server.py and app.py (through predictor.py).
+
+Artifacts are loaded by a single loader (registry.py) and every
+request goes through the same NumPy feature pipeline:
+[hour_of_day, is_peak_hour, weather_code, route_code], matching train.py.
+The Flask apps only turn Prediction tuples into their JSON responses.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from metrics import ENCODE, FEATURIZE, INTERVAL, MODEL, PREDICTION_PATH, UNKNOWN_LABELS
+from prediction_table import peak_mask
+from registry import ARTIFACTS_DIR, FEATURE_COLS, ArtifactRegistry
+from uncertainty import confidence
+
+
+DEFAULT_ROUTE = "R1"
+DEFAULT_WEATHER = "sunny"
+DEFAULT_HOUR = 8
+
+Prediction = namedtuple(
+    "Prediction",
+    ["delay", "status", "hour", "is_peak", "weather", "weather_code", "route_code", "from_model", "confidence"],
+    # confidence is 0-100 from the model's delay interval, None when it has none
+    defaults=(None,),
+)
+
+
+def parse_hour(scheduled):
+    scheduled = str(scheduled)
+    try:
+        if ":" in scheduled:
+            return int(scheduled.split(":")[0])
+        return int(scheduled[:2]) if len(scheduled) >= 2 else DEFAULT_HOUR
+    except ValueError:
+        return DEFAULT_HOUR
+
+
+def normalize_route(route):
+    return (route or DEFAULT_ROUTE).upper().strip()
+
+
+def normalize_weather(weather):
+    return (weather or DEFAULT_WEATHER).lower().strip()
+
+
+def trip_hour(scheduled):
+    return parse_hour(scheduled or "08:00")
+
+
+def normalize_trip(trip):
+    """Request payload -> (route, weather, hour) with the defaults the API has always used"""
+    route = normalize_route(trip.get("route_id"))
+    weather = normalize_weather(trip.get("weather"))
+    hour = trip_hour(trip.get("scheduled_time"))
+    return route, weather, hour
+
+
+def is_peak_hour(hour):
+    return 1 if (7 <= hour <= 9 or 16 <= hour <= 19) else 0
+
+
+def delay_status(delay):
+    if delay > 10:
+        return "High Delay"
+    if delay > 5:
+        return "Moderate Delay"
+    if delay > 0:
+        return "Minor Delay"
+    return "On Time"
+
+
+def fallback_delay(is_peak, weather):
+    """Heuristic used when no trained model is available"""
+    delay = 0
+    if weather == "rainy":
+        delay += 8.5
+    elif weather == "foggy":
+        delay += 5.2
+    elif weather == "cloudy":
+        delay += 1.5
+
+    if is_peak:
+        delay += 6.0
+    else:
+        delay -= 2.0
+
+    return max(0, delay)
+
+
+class InferenceEngine:
+    def __init__(
+        self,
+        artifacts_dir=ARTIFACTS_DIR,
+        use_table=False,
+        poll_interval=5.0,
+        compact=False,
+        mmap=False,
+        trees=False,
+    ):
+        # use_table precomputes the model over every (hour, weather, route) instead of calling it per request,
+        # compact serves from compact.npz without importing sklearn/xgboost,
+        # trees evaluates the exported trees (trees.npz) in NumPy, also without sklearn/xgboost,
+        # mmap maps artifact arrays read-only so pre-forked workers share them
+        self.registry = ArtifactRegistry(
+            artifacts_dir,
+            use_table=use_table,
+            poll_interval=poll_interval,
+            compact=compact,
+            mmap=mmap,
+            trees=trees,
+        )
+        self.registry.reload()
+
+    @property
+    def artifacts(self):
+        return self.registry.current
+
+    def reload(self, settle=0.0):
+        return self.registry.reload(settle)
+
+    @property
+    def model(self):
+        return self.artifacts.model
+
+    def featurize(self, trip, artifacts=None):
+        """One trip -> (features, hour, is_peak, weather) with features shaped (1, 4)"""
+        start = time.perf_counter()
+        artifacts = artifacts or self.artifacts
+        route, weather, hour = normalize_trip(trip)
+        is_peak = is_peak_hour(hour)
+
+        encode_start = time.perf_counter()
+        route_code = encode_label(artifacts.route_encoder, route, "route")
+        weather_code = encode_label(artifacts.weather_encoder, weather, "weather")
+        ENCODE.observe(time.perf_counter() - encode_start)
+
+        features = np.array([[hour, is_peak, weather_code, route_code]], dtype=np.int64)
+        FEATURIZE.observe(time.perf_counter() - start)
+        return features, hour, is_peak, weather
+
+    def featurize_batch(self, trips, artifacts=None):
+        """Same rules as featurize() but builds one feature matrix for all trips"""
+        start = time.perf_counter()
+        routes, weathers, hours = zip(*(normalize_trip(t) for t in trips))
+        features, hours, is_peak = self.featurize_normalized(routes, weathers, hours, artifacts)
+        FEATURIZE.observe(time.perf_counter() - start)
+        return features, hours, is_peak, list(weathers)
+
+    def featurize_normalized(self, routes, weathers, hours, artifacts=None):
+        """Vectorized half of featurize_batch(): normalized columns -> (features, hours, is_peak)"""
+        artifacts = artifacts or self.artifacts
+        hours = np.asarray(hours, dtype=np.int64)
+        is_peak = peak_mask(hours).astype(np.int64)
+
+        encode_start = time.perf_counter()
+        weather_codes = encode_column(artifacts.weather_encoder, weathers, "weather")
+        route_codes = encode_column(artifacts.route_encoder, routes, "route")
+        ENCODE.observe(time.perf_counter() - encode_start)
+
+        features = np.column_stack([hours, is_peak, weather_codes, route_codes])
+        return features, hours, is_peak
+
+    def predict_delays(self, features, is_peak, weathers, artifacts=None):
+        """One model call (or table lookup) for the whole feature matrix"""
+        artifacts = artifacts or self.artifacts
+        start = time.perf_counter()
+        if artifacts.table is not None:
+            path = "table"
+            delays = None
+            if len(features) == 1:
+                hour, _, weather_code, route_code = (int(v) for v in features[0])
+                delay = artifacts.table.lookup(hour, weather_code, route_code)
+                if delay is not None:
+                    delays = [float(delay)]
+            if delays is None:
+                delays = artifacts.table.predict(features).astype(float).tolist()
+        elif artifacts.model is not None:
+            path = "model"
+            delays = np.asarray(artifacts.model.predict(features)).astype(float).tolist()
+        else:
+            path = "heuristic"
+            delays = [fallback_delay(p, w) for p, w in zip(is_peak, weathers)]
+        MODEL.observe(time.perf_counter() - start)
+        PREDICTION_PATH.inc(path, amount=len(delays))
+        return delays
+
+    def confidences(self, features, delays, artifacts=None):
+        """0-100 per row from the interval model (or its table), None without one"""
+        artifacts = artifacts or self.artifacts
+        source = artifacts.interval_table if artifacts.interval_table is not None else artifacts.interval
+        if source is None:
+            return None
+        start = time.perf_counter()
+        scores = confidence(delays, source.predict(features), artifacts.confidence_calibration).tolist()
+        INTERVAL.observe(time.perf_counter() - start)
+        return scores
+
+    def forecast(self, routes, weathers, hours, artifacts=None):
+        """
+        Delay for every (route, hour) pair in one model call.
+
+        routes are labels, weathers one label per hour, hours ints; the
+        (route x hour) feature grid is built by broadcasting. Returns
+        (delays, confidences or None), each shaped (n_routes, n_hours).
+        """
+        artifacts = artifacts or self.artifacts
+        routes = [normalize_route(r) for r in routes]
+        weathers = [normalize_weather(w) for w in weathers]
+        hours = np.asarray(hours, dtype=np.int64)
+        shape = (len(routes), len(hours))
+
+        grid = np.empty(shape + (len(FEATURE_COLS),), dtype=np.int64)
+        grid[..., 0] = hours
+        grid[..., 1] = peak_mask(hours)
+        grid[..., 2] = encode_column(artifacts.weather_encoder, weathers, "weather")
+        grid[..., 3] = encode_column(artifacts.route_encoder, routes, "route")[:, None]
+        features = grid.reshape(-1, len(FEATURE_COLS))
+
+        row_weathers = np.broadcast_to(np.asarray(weathers, dtype=object), shape).ravel()
+        delays = self.predict_delays(features, features[:, 1], row_weathers, artifacts)
+        confidences = self.confidences(features, delays, artifacts)
+        delays = np.asarray(delays, dtype=np.float64).reshape(shape)
+        if confidences is not None:
+            confidences = np.asarray(confidences).reshape(shape)
+        return delays, confidences
+
+    def predict(self, trip, artifacts=None):
+        artifacts = artifacts or self.artifacts
+        features, hour, is_peak, weather = self.featurize(trip, artifacts)
+        return self.predict_featurized(features, hour, is_peak, weather, artifacts)
+
+    def predict_featurized(self, features, hour, is_peak, weather, artifacts=None):
+        """Second half of predict(), for callers that already ran featurize()"""
+        artifacts = artifacts or self.artifacts
+        delays = self.predict_delays(features, [is_peak], [weather], artifacts)
+        confidences = self.confidences(features, delays, artifacts)
+        delay = delays[0]
+        return Prediction(
+            delay,
+            delay_status(delay),
+            hour,
+            is_peak,
+            weather,
+            int(features[0, 2]),
+            int(features[0, 3]),
+            artifacts.model is not None,
+            confidences[0] if confidences is not None else None,
+        )
+
+    def predict_batch(self, trips):
+        if not trips:
+            return []
+        artifacts = self.artifacts
+        features, hours, is_peak, weathers = self.featurize_batch(trips, artifacts)
+        delays = self.predict_delays(features, is_peak, weathers, artifacts)
+        confidences = self.confidences(features, delays, artifacts) or [None] * len(delays)
+        from_model = artifacts.model is not None
+        return [
+            Prediction(d, delay_status(d), h, p, w, wc, rc, from_model, c)
+            for d, h, p, w, wc, rc, c in zip(
+                delays,
+                hours.tolist(),
+                is_peak.tolist(),
+                weathers,
+                features[:, 2].tolist(),
+                features[:, 3].tolist(),
+                confidences,
+            )
+        ]
+
+
+def encode_label(encoder, label, field):
+    """One label -> code, unknown labels fall back to 0 (and are counted)"""
+    if encoder is None:
+        return 0
+    code = encoder.encode(label)
+    if code == encoder.unknown_code and label not in encoder:
+        UNKNOWN_LABELS.inc(field)
+    return code
+
+
+def encode_column(encoder, labels, field=None):
+    """Encode a whole column at once, unknown labels fall back to 0 like featurize()"""
+    if encoder is None:
+        return np.zeros(len(labels), dtype=np.int64)
+    codes = encoder.transform(labels)
+    if field is not None:
+        # Only rows that got the fallback code can be unknown
+        fallback = codes == encoder.unknown_code
+        if fallback.any():
+            unknown = int((~encoder.known(np.asarray(labels)[fallback])).sum())
+            if unknown:
+                UNKNOWN_LABELS.inc(field, amount=unknown)
+    return codes
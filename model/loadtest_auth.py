@@ -0,0 +1,84 @@
+"""
+Concurrent load test for the auth endpoints of predict_server.py.
+
+Runs signup and login storms from many threads against a throwaway SQLite
+file and checks the invariants that the old check-then-insert broke:
+exactly one signup wins per email, and every registered user can log in.
+
+    python loadtest_auth.py [--threads 16] [--users 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run(threads, users, contenders):
+    tmp_dir = tempfile.mkdtemp(prefix="auth-load-")
+    os.environ["AUTH_DB"] = os.path.join(tmp_dir, "auth.sqlite")
+    os.environ.setdefault("ARTIFACTS_POLL_SECONDS", "0")
+    import predict_server
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = predict_server.app.test_client()
+        return local.client
+
+    rejected = []
+
+    def post(url, payload):
+        # 503 means the hashing pool shed load: back off and retry like a client would
+        while True:
+            resp = client().post(url, json=payload)
+            if resp.status_code != 503:
+                return resp.get_json()["success"]
+            rejected.append(url)
+            time.sleep(0.05)
+
+    def signup(email):
+        return post("/api/auth/signup", {"email": email, "password": "pw-" + email, "name": "load"})
+
+    def login(email):
+        return post("/api/auth/login", {"email": email, "password": "pw-" + email})
+
+    emails = [f"user{i}@load.test" for i in range(users)]
+    failures = []
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        contested = list(pool.map(signup, ["contested@load.test"] * contenders))
+        created = list(pool.map(signup, emails))
+        signup_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        logged_in = list(pool.map(login, emails * 2))
+        login_s = time.perf_counter() - start
+
+    if sum(contested) != 1:
+        failures.append(f"{sum(contested)} of {contenders} concurrent signups for one email succeeded")
+    if not all(created):
+        failures.append(f"{created.count(False)} unique signups failed")
+    if not all(logged_in):
+        failures.append(f"{logged_in.count(False)} logins failed")
+
+    n_signups = contenders + users
+    print(f"signup: {n_signups} requests in {signup_s:.2f}s ({n_signups / signup_s:.0f}/s)")
+    print(f"login:  {len(logged_in)} requests in {login_s:.2f}s ({len(logged_in) / login_s:.0f}/s)")
+    print(f"503 rejections retried: {len(rejected)}, hasher: {predict_server.hasher.stats()}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    return not failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--contenders", type=int, default=32)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.threads, args.users, args.contenders) else 1)
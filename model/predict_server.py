@@ -1,91 +1,194 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import joblib
 import os
-import numpy as np
-import sqlite3
+import hmac
 import json
-import pandas as pd
-from werkzeug.security import generate_password_hash, check_password_hash
+from functools import wraps
+import numpy as np
+from inference import (
+    InferenceEngine, ARTIFACTS_DIR, DEFAULT_ROUTE, DEFAULT_WEATHER, normalize_route, normalize_weather,
+)
+from registry import ArtifactsChanging
+from route_index import RouteIndex, DEFAULT_ROUTES
+from authdb import AuthDB
+from hashing import PasswordHasher, HasherBusy
+from batcher import MicroBatcher, BatchTimeout
+from response_cache import ResponseCache
+import metrics
+from metrics import ERRORS, SERIALIZE
 
 app = Flask(__name__)
 CORS(app)
 
 BASE = os.path.dirname(__file__)
-ART = os.path.join(BASE, 'artifacts')
-
-MODEL_PATH = os.path.join(ART, 'model.pkl')
-LE_ROUTE_PATH = os.path.join(ART, 'le_route.pkl')
-LE_WEATHER_PATH = os.path.join(ART, 'le_weather.pkl')
-METADATA_PATH = os.path.join(ART, 'metadata.pkl')
-
-model = None
-le_route = None
-le_weather = None
-metadata = None
-
-def load_artifacts():
-    global model, le_route, le_weather, metadata
-    if os.path.exists(MODEL_PATH):
-        model = joblib.load(MODEL_PATH)
-        print("✅ Model loaded successfully")
-    else:
-        print("⚠️ Model not found, using fallback prediction")
-        
-    if os.path.exists(LE_ROUTE_PATH):
-        le_route = joblib.load(LE_ROUTE_PATH)
-    if os.path.exists(LE_WEATHER_PATH):
-        le_weather = joblib.load(LE_WEATHER_PATH)
-    if os.path.exists(METADATA_PATH):
-        metadata = joblib.load(METADATA_PATH)
+
+# PREDICT_TABLE=1 serves /predict from a table precomputed over the whole feature domain
+USE_PREDICTION_TABLE = os.environ.get('PREDICT_TABLE', '0') == '1'
+# ARTIFACTS_FORMAT=compact loads compact.npz (NumPy only) instead of the pickled model and encoders
+USE_COMPACT_ARTIFACTS = os.environ.get('ARTIFACTS_FORMAT', 'pickle') == 'compact'
+# ARTIFACTS_FORMAT=trees walks the model's exported trees (trees.npz) in NumPy, same outputs as model.predict
+USE_TREE_ARTIFACTS = os.environ.get('ARTIFACTS_FORMAT', 'pickle') == 'trees'
+# MMAP_ARTIFACTS=1 memory-maps artifact arrays so pre-forked workers share one copy
+USE_MMAP_ARTIFACTS = os.environ.get('MMAP_ARTIFACTS', '0') == '1'
+# MICROBATCH_WAIT_MS>0 coalesces concurrent /predict calls into one model call per window
+MICROBATCH_WAIT_MS = float(os.environ.get('MICROBATCH_WAIT_MS', '0'))
+MICROBATCH_MAX_ROWS = int(os.environ.get('MICROBATCH_MAX_ROWS', '64'))
+MICROBATCH_TIMEOUT_MS = float(os.environ.get('MICROBATCH_TIMEOUT_MS', '1000'))
+# Serialized /predict responses keyed on the normalized features (RESPONSE_CACHE_SIZE=0 disables)
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '4096'))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '300'))
+# Upper bound on the trips scored by one /api/predict/batch call
+PREDICT_BATCH_MAX_ROWS = int(os.environ.get('PREDICT_BATCH_MAX_ROWS', '10000'))
+# Upper bound on routes x hours scored by one /api/forecast call
+FORECAST_MAX_ROWS = int(os.environ.get('FORECAST_MAX_ROWS', '100000'))
+# How often to look for retrained artifacts (seconds, 0 disables hot reload)
+ARTIFACTS_POLL_SECONDS = float(os.environ.get('ARTIFACTS_POLL_SECONDS', '5'))
+# The /api/admin routes are off unless ADMIN_TOKEN is set; callers send "Authorization: Bearer <token>"
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+# How long the artifact files must hold still before a forced reload loads them
+ADMIN_RELOAD_SETTLE_SECONDS = float(os.environ.get('ADMIN_RELOAD_SETTLE_SECONDS', '1'))
 
 # Auth DB
-AUTH_DB = os.path.join(BASE, 'auth.sqlite')
-
-def init_auth_db():
-    conn = sqlite3.connect(AUTH_DB)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        email TEXT PRIMARY KEY,
-        password_hash TEXT,
-        name TEXT
-    )''')
-    conn.commit()
-    conn.close()
-
-init_auth_db()
-load_artifacts()
-
-def featurize(payload):
-    r = (payload.get('route_id') or 'R1').upper().strip()
-    w = (payload.get('weather') or 'sunny').lower().strip()
-    scheduled = payload.get('scheduled_time') or '08:00'
+AUTH_DB = os.environ.get('AUTH_DB', os.path.join(BASE, 'auth.sqlite'))
+auth_db = AuthDB(AUTH_DB)
+
+# Password KDFs run in a bounded process pool so login bursts don't starve /predict
+hasher = PasswordHasher(
+    max_workers=int(os.environ.get('HASH_WORKERS', '0')) or None,
+    max_pending=int(os.environ.get('HASH_QUEUE', '0')) or None,
+)
+# Fork the hashing workers while this is the only thread, before the engine and watcher start
+hasher.start()
+
+ERR_FIELDS_REQUIRED = 'البريد وكلمة المرور مطلوبان'
+ERR_USER_EXISTS = 'المستخدم موجود بالفعل'
+ERR_BAD_CREDENTIALS = 'بيانات خاطئة'
+ERR_SERVER_BUSY = 'الخادم مشغول، حاول مرة أخرى / Server busy, retry'
+ERR_ADMIN_FORBIDDEN = 'admin token required'
+
+def auth_busy():
+    response = jsonify({'success': False, 'error': ERR_SERVER_BUSY})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+auth_db.init_schema()
+engine = InferenceEngine(
+    ARTIFACTS_DIR,
+    use_table=USE_PREDICTION_TABLE,
+    poll_interval=ARTIFACTS_POLL_SECONDS,
+    compact=USE_COMPACT_ARTIFACTS,
+    trees=USE_TREE_ARTIFACTS,
+    mmap=USE_MMAP_ARTIFACTS,
+)
+engine.registry.start()
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+engine.registry.on_swap(response_cache.clear)
+
+batcher = None
+if MICROBATCH_WAIT_MS > 0:
+    batcher = MicroBatcher(
+        engine.predict_batch,
+        max_batch=MICROBATCH_MAX_ROWS,
+        max_wait=MICROBATCH_WAIT_MS / 1000,
+        timeout=MICROBATCH_TIMEOUT_MS / 1000,
+    )
+
+# Read at scrape time from the components' own counters
+metrics.REGISTRY.callback('transport_response_cache_hits_total', 'Response cache hits', lambda: response_cache.hits, 'counter')
+metrics.REGISTRY.callback('transport_response_cache_misses_total', 'Response cache misses', lambda: response_cache.misses, 'counter')
+metrics.REGISTRY.callback('transport_response_cache_entries', 'Responses currently cached', lambda: response_cache.stats()['size'])
+metrics.REGISTRY.callback('transport_batcher_queue_depth', 'Requests waiting for a micro-batch', lambda: batcher.stats()['queue_depth'] if batcher is not None else None)
+metrics.REGISTRY.callback('transport_hasher_rejected_total', 'Password hashes refused because the queue was full', lambda: hasher.rejected, 'counter')
+metrics.REGISTRY.callback('transport_model_swaps_total', 'Artifact hot reloads', lambda: engine.registry.swaps, 'counter')
+metrics.REGISTRY.callback('transport_model_reload_failing', '1 while the last artifact reload failed', lambda: int(engine.registry.last_error is not None))
+
+# جرب مسارات مختلفة للـ CSV
+route_index = RouteIndex(
+    [
+        os.path.join(BASE, 'cleaned_transport_data (2).csv'),
+        os.path.join(BASE, '..', 'cleaned_transport_data (2).csv'),
+        'cleaned_transport_data (2).csv'
+    ],
+    artifacts_source=lambda: engine.artifacts,
+)
+route_index.get()
+
+def preload():
+    """Pre-fork hook, see gunicorn.conf.py: artifacts are loaded once in the master"""
+    engine.registry.preload()
+    # Each worker forks its own hashing pool in post_fork()
+    hasher.shutdown()
+
+def post_fork():
+    hasher.start()
+    engine.registry.start()
+
+# Weathers that get their own reason line, anything else is "good weather"
+REASON_WEATHERS = ('rainy', 'foggy', 'cloudy')
+
+def build_prediction(pred):
+    weather = pred.weather
     
-    hour = 8
-    try:
-        if ':' in str(scheduled):
-            hour = int(str(scheduled).split(':')[0])
-        else:
-            hour = int(str(scheduled)[:2]) if len(str(scheduled)) >= 2 else 8
-    except:
-        hour = 8
+    # Generate reasons
+    reasons = []
+    if weather == 'rainy':
+        reasons.append({'factor': 'طقس ممطر / Rainy Weather', 'impact': '+8.5 دقيقة'})
+    elif weather == 'foggy':
+        reasons.append({'factor': 'ضباب / Foggy Conditions', 'impact': '+5.2 دقيقة'})
+    elif weather == 'cloudy':
+        reasons.append({'factor': 'غيوم / Cloudy Sky', 'impact': '+1.5 دقيقة'})
+    else:
+        reasons.append({'factor': 'طقس جيد / Good Weather', 'impact': 'إيجابي'})
     
-    is_peak = 1 if (7 <= hour <= 9 or 16 <= hour <= 19) else 0
+    if pred.is_peak:
+        reasons.append({'factor': 'وقت الذروة / Peak Hour', 'impact': '+6.0 دقيقة'})
+    else:
+        reasons.append({'factor': 'وقت عادي / Off-Peak', 'impact': 'إيجابي'})
     
-    # Encode route
-    try:
-        route_code = int(le_route.transform([r])[0]) if le_route is not None else 0
-    except:
-        route_code = 0
+    confidence = pred.confidence
+    if confidence is None:
+        # Artifacts without an interval model (e.g. XGBoost trained before quantiles.pkl)
+        confidence = 85 if pred.from_model else 70
     
-    # Encode weather
-    try:
-        weather_code = int(le_weather.transform([w])[0]) if le_weather is not None else 0
-    except:
-        weather_code = 0
+    return {
+        'delay': round(pred.delay, 1),
+        'status': pred.status,
+        'confidence': confidence,
+        'reasons': reasons
+    }
+
+def cached_prediction(payload):
+    """featurize + cache lookup -> (key, body or None, featurized)"""
+    artifacts = engine.artifacts
+    features, hour, is_peak, weather = engine.featurize(payload, artifacts)
     
-    features = np.array([[hour, is_peak, weather_code, route_code]])
-    return features, hour, is_peak, w
+    # The response only depends on these (is_peak follows from the hour)
+    key = (
+        artifacts.version,
+        hour,
+        int(features[0, 2]),
+        int(features[0, 3]),
+        weather if weather in REASON_WEATHERS else '',
+    )
+    body = response_cache.get(key) if response_cache.enabled else None
+    return key, body, (features, hour, is_peak, weather, artifacts)
+
+def compute_prediction(payload, key, featurized):
+    """Cache miss: run inference, serialize and remember the response bytes"""
+    if batcher is not None:
+        pred = batcher.submit(payload)
+    else:
+        pred = engine.predict_featurized(*featurized)
+    with SERIALIZE.time():
+        body = render_json(build_prediction(pred))
+    response_cache.put(key, body)
+    return body
+
+def render_json(obj):
+    """Exactly the bytes jsonify() would send"""
+    return app.json.response(obj).get_data()
 
 @app.route('/predict', methods=['POST'])
 @app.route('/api/predict', methods=['POST'])
@@ -93,66 +196,149 @@ def predict():
     payload = request.get_json() or {}
     
     try:
-        features, hour, is_peak, weather = featurize(payload)
-        
-        # Predict using model if available
-        if model is not None:
-            pred = model.predict(features)
-            delay = float(pred[0])
-        else:
-            # Fallback heuristic prediction
-            delay = 0
-            if weather == 'rainy':
-                delay += 8.5
-            elif weather == 'foggy':
-                delay += 5.2
-            elif weather == 'cloudy':
-                delay += 1.5
-            
-            if is_peak:
-                delay += 6.0
-            else:
-                delay -= 2.0
-            
-            delay = max(0, delay)
+        key, body, featurized = cached_prediction(payload)
+        if body is None:
+            body = compute_prediction(payload, key, featurized)
+        return app.response_class(body, mimetype=app.json.mimetype)
         
-        # Determine status
-        if delay > 10:
-            status = 'High Delay'
-        elif delay > 5:
-            status = 'Moderate Delay'
-        elif delay > 0:
-            status = 'Minor Delay'
-        else:
-            status = 'On Time'
-        
-        # Generate reasons
-        reasons = []
-        if weather == 'rainy':
-            reasons.append({'factor': 'طقس ممطر / Rainy Weather', 'impact': '+8.5 دقيقة'})
-        elif weather == 'foggy':
-            reasons.append({'factor': 'ضباب / Foggy Conditions', 'impact': '+5.2 دقيقة'})
-        elif weather == 'cloudy':
-            reasons.append({'factor': 'غيوم / Cloudy Sky', 'impact': '+1.5 دقيقة'})
-        else:
-            reasons.append({'factor': 'طقس جيد / Good Weather', 'impact': 'إيجابي'})
-        
-        if is_peak:
-            reasons.append({'factor': 'وقت الذروة / Peak Hour', 'impact': '+6.0 دقيقة'})
-        else:
-            reasons.append({'factor': 'وقت عادي / Off-Peak', 'impact': 'إيجابي'})
-        
-        confidence = 85 if model is not None else 70
+    except BatchTimeout as e:
+        print(f"❌ Prediction timeout: {str(e)}")
+        ERRORS.inc('/api/predict', 'timeout')
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        print(f"❌ Prediction error: {str(e)}")
+        ERRORS.inc('/api/predict', 'exception')
+        return jsonify({'error': str(e)}), 500
+
+
+BATCH_FORMAT_ERROR = 'expected a JSON array of trips'
+
+def batch_trips(payload):
+    """JSON array or {"trips": [...]} -> list of trip dicts, None if malformed"""
+    trips = payload.get('trips') if isinstance(payload, dict) else payload
+    if not isinstance(trips, list) or not all(isinstance(t, dict) for t in trips):
+        return None
+    return trips
+
+def batch_error(trips):
+    """Why batch_trips()' result gets a 400, None when it can be scored"""
+    if trips is None:
+        return BATCH_FORMAT_ERROR
+    if len(trips) > PREDICT_BATCH_MAX_ROWS:
+        return f'{len(trips)} trips is over the {PREDICT_BATCH_MAX_ROWS} trip limit'
+    return None
+
+def predict_batch_response(trips):
+    return {'predictions': [build_prediction(p) for p in engine.predict_batch(trips)]}
+
+@app.route('/predict/batch', methods=['POST'])
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch():
+    """يتنبأ بمجموعة رحلات في استدعاء واحد للنموذج"""
+    trips = batch_trips(request.get_json(silent=True))
+    error = batch_error(trips)
+    if error is not None:
+        ERRORS.inc('/api/predict/batch', 'bad_request')
+        return jsonify({'error': error}), 400
+    
+    try:
+        body = predict_batch_response(trips)
+        with SERIALIZE.time():
+            return jsonify(body)
         
-        return jsonify({
-            'delay': round(delay, 1),
-            'status': status,
-            'confidence': confidence,
-            'reasons': reasons
+    except Exception as e:
+        print(f"❌ Batch prediction error: {str(e)}")
+        ERRORS.inc('/api/predict/batch', 'exception')
+        return jsonify({'error': str(e)}), 500
+
+
+class ForecastError(ValueError):
+    """Bad /api/forecast parameters, answered with 400"""
+
+def as_list(value, name):
+    """JSON list of strings or a comma-separated string (query string) -> list, None if absent"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return value.split(',')
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return value
+    raise ForecastError(f'{name} must be a string or a list of strings')
+
+def forecast_params(payload, artifacts):
+    """{routes, weather, start_hour, end_hour} -> (known routes, unknown routes, weathers per hour, hours)"""
+    try:
+        start = int(payload.get('start_hour', 0))
+        end = int(payload.get('end_hour', 23))
+    except (TypeError, ValueError):
+        raise ForecastError('start_hour and end_hour must be integers')
+    if not 0 <= start <= end <= 23:
+        raise ForecastError('expected 0 <= start_hour <= end_hour <= 23')
+    hours = list(range(start, end + 1))
+
+    encoder = artifacts.route_encoder
+    routes = as_list(payload.get('routes'), 'routes')
+    if routes is None:
+        routes = encoder.classes_.tolist() if encoder is not None else [DEFAULT_ROUTE]
+    routes = list(dict.fromkeys(normalize_route(r) for r in routes))
+    # Unknown routes would be encoded as route 0 and get its curve under their own name
+    unknown_routes = [r for r in routes if r not in encoder] if encoder is not None else []
+    if unknown_routes:
+        routes = [r for r in routes if r in encoder]
+        if not routes:
+            raise ForecastError(f'unknown routes: {", ".join(unknown_routes)}')
+
+    # One weather for the whole day, or one per hour of the range
+    weathers = as_list(payload.get('weather'), 'weather') or [DEFAULT_WEATHER]
+    if len(weathers) == 1:
+        weathers = weathers * len(hours)
+    elif len(weathers) != len(hours):
+        raise ForecastError(f'weather needs 1 value or {len(hours)} (one per hour), got {len(weathers)}')
+    weathers = [normalize_weather(w) for w in weathers]
+
+    if len(routes) * len(hours) > FORECAST_MAX_ROWS:
+        raise ForecastError(f'{len(routes)} routes x {len(hours)} hours is over the {FORECAST_MAX_ROWS} row limit')
+    return routes, unknown_routes, weathers, hours
+
+def round_delays(delays):
+    """round(delay, 1) as /api/predict does, run once per distinct value (rows repeat a lot)"""
+    values, inverse = np.unique(delays, return_inverse=True)
+    rounded = np.array([round(v, 1) for v in values.tolist()])
+    return rounded[inverse].reshape(delays.shape).tolist()
+
+def forecast_response(payload):
+    """Columnar forecast body; delay[i][j] is routes[i] at hours[j], unknown_routes are left out"""
+    artifacts = engine.artifacts
+    routes, unknown_routes, weathers, hours = forecast_params(payload, artifacts)
+    delays, confidences = engine.forecast(routes, weathers, hours, artifacts)
+    with SERIALIZE.time():
+        return render_json({
+            'version': artifacts.version,
+            'hours': hours,
+            'routes': routes,
+            'unknown_routes': unknown_routes,
+            'weather': weathers,
+            'delay': round_delays(delays),
+            'confidence': confidences.tolist() if confidences is not None else None,
         })
+
+@app.route('/forecast', methods=['GET', 'POST'])
+@app.route('/api/forecast', methods=['GET', 'POST'])
+def forecast():
+    """منحنى التأخير لكل الطرق على مدار اليوم في استدعاء واحد للنموذج"""
+    payload = (request.get_json() or {}) if request.method == 'POST' else request.args.to_dict()
+    
+    try:
+        if not isinstance(payload, dict):
+            raise ForecastError('expected a JSON object')
+        return app.response_class(forecast_response(payload), mimetype=app.json.mimetype)
         
+    except ForecastError as e:
+        ERRORS.inc('/api/forecast', 'bad_request')
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"❌ Prediction error: {str(e)}")
+        print(f"❌ Forecast error: {str(e)}")
+        ERRORS.inc('/api/forecast', 'exception')
         return jsonify({'error': str(e)}), 500
 
 
@@ -165,20 +351,19 @@ def auth_signup():
     name = payload.get('name') or ''
     
     if not email or not password:
-        return jsonify({'success': False, 'error': 'البريد وكلمة المرور مطلوبان'})
-    
-    conn = sqlite3.connect(AUTH_DB)
-    c = conn.cursor()
-    c.execute('SELECT email FROM users WHERE email=?', (email,))
+        return jsonify({'success': False, 'error': ERR_FIELDS_REQUIRED})
     
-    if c.fetchone():
-        conn.close()
-        return jsonify({'success': False, 'error': 'المستخدم موجود بالفعل'})
+    # Cheap early answer; the INSERT below still settles races atomically
+    if auth_db.get_user(email):
+        return jsonify({'success': False, 'error': ERR_USER_EXISTS})
     
-    ph = generate_password_hash(password)
-    c.execute('INSERT INTO users(email,password_hash,name) VALUES(?,?,?)', (email, ph, name))
-    conn.commit()
-    conn.close()
+    try:
+        ph = hasher.hash(password)
+    except HasherBusy:
+        ERRORS.inc('/api/auth/signup', 'busy')
+        return auth_busy()
+    if not auth_db.create_user(email, ph, name):
+        return jsonify({'success': False, 'error': ERR_USER_EXISTS})
     
     return jsonify({'success': True, 'user': {'email': email, 'name': name}})
 
@@ -191,20 +376,21 @@ def auth_login():
     password = payload.get('password')
     
     if not email or not password:
-        return jsonify({'success': False, 'error': 'البريد وكلمة المرور مطلوبان'})
+        return jsonify({'success': False, 'error': ERR_FIELDS_REQUIRED})
     
-    conn = sqlite3.connect(AUTH_DB)
-    c = conn.cursor()
-    c.execute('SELECT password_hash,name FROM users WHERE email=?', (email,))
-    row = c.fetchone()
-    conn.close()
+    row = auth_db.get_user(email)
     
     if not row:
-        return jsonify({'success': False, 'error': 'بيانات خاطئة'})
+        return jsonify({'success': False, 'error': ERR_BAD_CREDENTIALS})
     
     ph, name = row
-    if not check_password_hash(ph or '', password):
-        return jsonify({'success': False, 'error': 'بيانات خاطئة'})
+    try:
+        verified = hasher.verify(email, ph, password)
+    except HasherBusy:
+        ERRORS.inc('/api/auth/login', 'busy')
+        return auth_busy()
+    if not verified:
+        return jsonify({'success': False, 'error': ERR_BAD_CREDENTIALS})
     
     return jsonify({'success': True, 'user': {'email': email, 'name': name or ''}})
 
@@ -212,50 +398,96 @@ def auth_login():
 @app.route('/routes', methods=['GET'])
 @app.route('/api/routes', methods=['GET'])
 def api_routes():
-    """يقرأ الطرق من ملف CSV الحقيقي"""
+    """يقرأ الطرق من ملف CSV الحقيقي (مع التخزين المؤقت)"""
     try:
-        # جرب مسارات مختلفة للـ CSV
-        possible_paths = [
-            os.path.join(BASE, 'cleaned_transport_data (2).csv'),
-            os.path.join(BASE, '..', 'cleaned_transport_data (2).csv'),
-            'cleaned_transport_data (2).csv'
-        ]
-        
-        csv_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                csv_path = path
-                break
-        
-        if not csv_path:
-            print("⚠️ CSV not found, using default routes")
-            return jsonify({'routes': ['R1', 'R2', 'R3', 'R4']})
-        
-        # اقرأ الـ CSV
-        df = pd.read_csv(csv_path)
-        
-        if 'route_id' in df.columns:
-            routes = sorted(df['route_id'].dropna().unique().tolist())
-            print(f"✅ Loaded {len(routes)} routes from CSV")
-            return jsonify({'routes': routes})
-        else:
-            print("⚠️ route_id column not found")
-            return jsonify({'routes': ['R1', 'R2', 'R3', 'R4']})
-            
+        routes = route_index.get()
     except Exception as e:
         print(f"❌ Error reading routes: {str(e)}")
-        return jsonify({'routes': ['R1', 'R2', 'R3', 'R4']})
+        ERRORS.inc('/api/routes', 'exception')
+        return jsonify({'routes': DEFAULT_ROUTES})
+    
+    response = jsonify({'routes': routes.routes})
+    response.set_etag(routes.etag)
+    if routes.last_modified is not None:
+        response.last_modified = routes.last_modified
+    # Browsers keep the list but revalidate it on every page load
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
-@app.route('/')
-def home():
+def admin_allowed(authorization):
+    """Authorization header -> True if it carries ADMIN_TOKEN (always False while ADMIN_TOKEN is unset)"""
+    scheme, _, token = (authorization or '').partition(' ')
+    if not ADMIN_TOKEN or scheme.lower() != 'bearer':
+        return False
+    return hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode())
+
+def admin_only(view):
+    @wraps(view)
+    def guarded(*args, **kwargs):
+        if not admin_allowed(request.headers.get('Authorization')):
+            return jsonify({'error': ERR_ADMIN_FORBIDDEN}), 403
+        return view(*args, **kwargs)
+    return guarded
+
+def reload_busy(e):
+    """Forced reload raced a train.py write: nothing was published, retry shortly"""
+    return {'error': str(e), **engine.registry.status()}, 503, {'Retry-After': '1'}
+
+
+@app.route('/admin/model', methods=['GET'])
+@app.route('/api/admin/model', methods=['GET'])
+@admin_only
+def admin_model():
+    """نسخة النموذج الحالية"""
+    return jsonify(engine.registry.status())
+
+
+@app.route('/admin/stats', methods=['GET'])
+@app.route('/api/admin/stats', methods=['GET'])
+@admin_only
+def admin_stats():
     return jsonify({
-        'status': 'running',
-        'message': '🚌 Transport Delay Prediction API',
-        'endpoints': ['/api/predict', '/api/routes', '/api/auth/login', '/api/auth/signup']
+        'model': engine.registry.status(),
+        'batcher': batcher.stats() if batcher is not None else None,
+        'hasher': hasher.stats(),
+        'response_cache': response_cache.stats(),
     })
 
 
+@app.route('/admin/model/reload', methods=['POST'])
+@app.route('/api/admin/model/reload', methods=['POST'])
+@admin_only
+def admin_model_reload():
+    try:
+        engine.reload(ADMIN_RELOAD_SETTLE_SECONDS)
+    except ArtifactsChanging as e:
+        body, status, headers = reload_busy(e)
+        return jsonify(body), status, headers
+    except Exception as e:
+        print(f"❌ Reload error: {str(e)}")
+        ERRORS.inc('/api/admin/model/reload', 'exception')
+        return jsonify({'error': str(e), **engine.registry.status()}), 500
+    return jsonify(engine.registry.status())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text format: stage timings, fallback/path counters, cache and queue gauges"""
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+HOME = {
+    'status': 'running',
+    'message': '🚌 Transport Delay Prediction API',
+    'endpoints': ['/api/predict', '/api/predict/batch', '/api/forecast', '/api/routes', '/api/auth/login', '/api/auth/signup', '/api/admin/model']
+}
+
+@app.route('/')
+def home():
+    return jsonify(HOME)
+
+
 if __name__ == '__main__':
     print("=" * 50)
     print("🚀 Starting Transport Delay Prediction Server")
@@ -263,9 +495,13 @@ if __name__ == '__main__':
     print("📍 Server: http://127.0.0.1:5000")
     print("📊 API Endpoints:")
     print("   • POST /api/predict - التنبؤ بالتأخير")
+    print("   • POST /api/predict/batch - التنبؤ لمجموعة رحلات")
+    print("   • GET/POST /api/forecast - منحنى التأخير لكل الطرق")
     print("   • GET  /api/routes - قائمة الطرق")
     print("   • POST /api/auth/login - تسجيل دخول")
     print("   • POST /api/auth/signup - تسجيل جديد")
+    print("   • GET  /api/admin/model - نسخة النموذج الحالية")
+    print("   • GET  /metrics - Prometheus metrics")
     print("=" * 50)
     
     app.run(host='127.0.0.1', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+HOURS = 24
+
+
+def peak_mask(hours):
+    return ((hours >= 7) & (hours <= 9)) | ((hours >= 16) & (hours <= 19))
+
+
+def domain_grid(n_weather, n_route):
+    """Every [hour, is_peak, weather_code, route_code] row featurize() can produce, hour-major"""
+    hour, weather, route = np.meshgrid(
+        np.arange(HOURS), np.arange(n_weather), np.arange(n_route), indexing="ij"
+    )
+    return np.column_stack(
+        [
+            hour.ravel(),
+            peak_mask(hour.ravel()).astype(np.int64),
+            weather.ravel(),
+            route.ravel(),
+        ]
+    )
+
+
+class PredictionTable:
+    """
+    Model output for every (hour, weather_code, route_code) combination.
+
+    featurize() only ever produces 24 hours x known weathers x known routes
+    (is_peak is derived from the hour), so the whole domain is scored once
+    at load time and requests become an array lookup. Rows outside the
+    table (hours that are not 0-23) still go through the model.
+    Models with several outputs per row (interval bounds) keep them as
+    trailing axes.
+    """
+
+    def __init__(self, model, n_weather, n_route):
+        self.model = model
+        grid = domain_grid(n_weather, n_route)
+        values = np.asarray(model.predict(grid))
+        self.values = values.reshape((HOURS, n_weather, n_route) + values.shape[1:])
+
+    def predict(self, features):
+        """Drop-in for model.predict on [hour, is_peak, weather_code, route_code] rows"""
+        features = np.asarray(features)
+        hours = features[:, 0].astype(np.int64)
+        weather_codes = features[:, 2].astype(np.int64)
+        route_codes = features[:, 3].astype(np.int64)
+        n_hour, n_weather, n_route = self.values.shape[:3]
+
+        inside = (
+            (hours >= 0) & (hours < n_hour)
+            & (weather_codes >= 0) & (weather_codes < n_weather)
+            & (route_codes >= 0) & (route_codes < n_route)
+        )
+        out = np.empty((len(features),) + self.values.shape[3:], dtype=self.values.dtype)
+        out[inside] = self.values[hours[inside], weather_codes[inside], route_codes[inside]]
+        if not inside.all():
+            out[~inside] = self.model.predict(features[~inside])
+        return out
+
+    def lookup(self, hour, weather_code, route_code):
+        """Scalar path; returns None when the row is outside the table"""
+        n_hour, n_weather, n_route = self.values.shape[:3]
+        if 0 <= hour < n_hour and 0 <= weather_code < n_weather and 0 <= route_code < n_route:
+            return self.values[hour, weather_code, route_code]
+        return None
@@ -0,0 +1,354 @@
+"""
+Artifact loading and hot reload.
+
+An Artifacts bundle (model, encoders, metadata and anything derived from
+them) is built completely before it is published, and publishing is a
+single attribute assignment. Request handlers read registry.current once
+and use that snapshot for the whole request, so a swap never exposes a
+half-loaded set.
+"""
+import gc
+import hashlib
+import os
+import threading
+import time
+
+from compact import COMPACT_FILE, load_compact
+from encoders import FastLabelEncoder
+from prediction_table import PredictionTable
+from trees import TREES_FILE, load_trees
+from uncertainty import QUANTILES_FILE, interval_model
+
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+ARTIFACTS_DIR = os.environ.get("ARTIFACTS_DIR", os.path.join(BASE, "artifacts"))
+
+FEATURE_COLS = ["hour_of_day", "is_peak_hour", "weather_code", "route_code"]
+
+ARTIFACT_FILES = ["model.pkl", "le_route.pkl", "le_weather.pkl", "metadata.pkl", QUANTILES_FILE]
+
+
+class ArtifactsChanging(RuntimeError):
+    """A forced reload found the artifact files still being written"""
+
+
+class Artifacts:
+    """A model, its encoders and metadata, loaded together and never mutated"""
+
+    def __init__(
+        self,
+        model=None,
+        le_route=None,
+        le_weather=None,
+        metadata=None,
+        use_table=False,
+        version=None,
+        quantiles=None,
+        interval=None,
+    ):
+        self.model = model
+        self.le_route = le_route
+        self.le_weather = le_weather
+        self.metadata = metadata or {}
+        self.version = version
+        self.loaded_at = time.time()
+        # Quantile boosters from quantiles.pkl (XGBoost), see uncertainty.py
+        self.quantiles = quantiles
+        # predict(features) -> (n, 2) delay bounds; None means no confidence beyond the fixed values
+        if interval is None and model is not None:
+            interval = interval_model(model, quantiles, self.metadata.get("interval_margin"))
+        self.interval = interval
+        # Raw confidence -> held-out hit rate, see uncertainty.calibrate_confidence
+        self.confidence_calibration = self.metadata.get("confidence_calibration")
+
+        # Unknown labels encode to 0, as they always have at serving time
+        self.route_encoder = (
+            FastLabelEncoder.from_label_encoder(le_route, unknown_code=0)
+            if le_route is not None
+            else None
+        )
+        self.weather_encoder = (
+            FastLabelEncoder.from_label_encoder(le_weather, unknown_code=0)
+            if le_weather is not None
+            else None
+        )
+
+        self.table = None
+        self.interval_table = None
+        if use_table and model is not None:
+            n_weather = len(self.weather_encoder) if self.weather_encoder is not None else 1
+            n_route = len(self.route_encoder) if self.route_encoder is not None else 1
+            self.table = PredictionTable(model, n_weather, n_route)
+            if interval is not None:
+                self.interval_table = PredictionTable(interval, n_weather, n_route)
+
+
+def stat_fingerprint(artifacts_dir, files=ARTIFACT_FILES):
+    """Cheap change detector: (name, mtime, size) of every artifact file"""
+    fingerprint = []
+    for name in files:
+        try:
+            st = os.stat(os.path.join(artifacts_dir, name))
+            fingerprint.append((name, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            fingerprint.append((name, None, None))
+    return tuple(fingerprint)
+
+
+def content_version(artifacts_dir, files=ARTIFACT_FILES):
+    """Short content hash of the artifact files, used as the model version"""
+    digest = hashlib.sha256()
+    for name in files:
+        path = os.path.join(artifacts_dir, name)
+        if not os.path.exists(path):
+            continue
+        digest.update(name.encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def validate_artifacts(artifacts):
+    """Reject sets that would silently mis-encode requests"""
+    feature_cols = artifacts.metadata.get("feature_cols")
+    if feature_cols is not None and list(feature_cols) != FEATURE_COLS:
+        raise ValueError(f"metadata feature_cols {feature_cols} != {FEATURE_COLS}")
+
+    model = artifacts.model
+    if model is None:
+        return
+    n_features = getattr(model, "n_features_in_", None)
+    if n_features is not None and n_features != len(FEATURE_COLS):
+        raise ValueError(f"model expects {n_features} features, serving builds {len(FEATURE_COLS)}")
+    names = getattr(model, "feature_names_in_", None)
+    if names is not None and list(names) != FEATURE_COLS:
+        raise ValueError(f"model was trained on {list(names)}, serving builds {FEATURE_COLS}")
+
+
+def load_artifacts(artifacts_dir=ARTIFACTS_DIR, use_table=False, compact=False, mmap=False, trees=False):
+    """
+    compact=True loads compact.npz (NumPy only, see compact.py) instead of
+    unpickling model.pkl, which would import sklearn/xgboost. trees=True
+    loads trees.npz, the model's own trees evaluated in NumPy (trees.py).
+
+    mmap=True maps the arrays read-only from the files (joblib mmap_mode='r'
+    for the pickles) so workers on a node share them through the page cache.
+    """
+    compact_path = os.path.join(artifacts_dir, COMPACT_FILE)
+    if compact:
+        if os.path.exists(compact_path):
+            model, route_classes, weather_classes, metadata, interval = load_compact(compact_path, mmap=mmap)
+            return Artifacts(
+                model=model,
+                le_route=FastLabelEncoder(route_classes),
+                le_weather=FastLabelEncoder(weather_classes),
+                metadata=metadata,
+                interval=interval,
+                version=content_version(artifacts_dir, [COMPACT_FILE]),
+            )
+        print(f"⚠️ {COMPACT_FILE} not found, loading pickled artifacts")
+
+    trees_path = os.path.join(artifacts_dir, TREES_FILE)
+    if trees:
+        if os.path.exists(trees_path):
+            model, route_classes, weather_classes, metadata, interval = load_trees(trees_path, mmap=mmap)
+            return Artifacts(
+                model=model,
+                le_route=FastLabelEncoder(route_classes),
+                le_weather=FastLabelEncoder(weather_classes),
+                metadata=metadata,
+                interval=interval,
+                use_table=use_table,
+                version=content_version(artifacts_dir, [TREES_FILE]),
+            )
+        print(f"⚠️ {TREES_FILE} not found, loading pickled artifacts")
+
+    import joblib
+
+    def load(name):
+        path = os.path.join(artifacts_dir, name)
+        if not os.path.exists(path):
+            return None
+        return joblib.load(path, mmap_mode="r" if mmap else None)
+
+    version = content_version(artifacts_dir)
+    return Artifacts(
+        model=load("model.pkl"),
+        le_route=load("le_route.pkl"),
+        le_weather=load("le_weather.pkl"),
+        metadata=load("metadata.pkl"),
+        use_table=use_table,
+        version=version,
+        quantiles=load(QUANTILES_FILE),
+    )
+
+
+class ArtifactRegistry:
+    """
+    Holds the active Artifacts and swaps in new ones when the files change.
+
+    check() compares file stats; a change is only loaded once the stats have
+    been stable for one poll (train.py writes several files in a row), the
+    new set is validated, and the files are re-checked after loading so a
+    write that raced the load is picked up on the next poll instead.
+    """
+
+    def __init__(
+        self,
+        artifacts_dir=ARTIFACTS_DIR,
+        use_table=False,
+        poll_interval=5.0,
+        compact=False,
+        mmap=False,
+        trees=False,
+    ):
+        self.artifacts_dir = artifacts_dir
+        self.use_table = use_table
+        self.compact = compact
+        self.mmap = mmap
+        self.trees = trees
+        if compact:
+            self.files = [COMPACT_FILE]
+        elif trees:
+            self.files = [TREES_FILE]
+        else:
+            self.files = ARTIFACT_FILES
+        self.poll_interval = poll_interval
+        self.current = None
+        self.last_error = None
+        self.swaps = 0
+        self._fingerprint = None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+        # Threads and held locks do not survive fork(), see preload() / start()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def reload(self, settle=0.0):
+        """
+        Load and publish the current files without waiting for a poll.
+        settle > 0 (the admin endpoint) applies check()'s guards: the stats
+        must hold still for settle seconds before loading and be unchanged
+        after it, otherwise ArtifactsChanging is raised and nothing is
+        published.
+        """
+        with self._lock:
+            fingerprint = stat_fingerprint(self.artifacts_dir, self.files)
+            if settle > 0:
+                time.sleep(settle)
+                if stat_fingerprint(self.artifacts_dir, self.files) != fingerprint:
+                    raise ArtifactsChanging("artifact files are being written, retry the reload")
+            artifacts = load_artifacts(self.artifacts_dir, self.use_table, self.compact, self.mmap, self.trees)
+            validate_artifacts(artifacts)
+            if settle > 0 and stat_fingerprint(self.artifacts_dir, self.files) != fingerprint:
+                raise ArtifactsChanging("artifact files changed during the reload, retry")
+            self._publish(artifacts, fingerprint)
+            return artifacts
+
+    def check(self):
+        """Reload if the files changed and have settled; returns True on swap"""
+        with self._lock:
+            fingerprint = stat_fingerprint(self.artifacts_dir, self.files)
+            if fingerprint == self._fingerprint:
+                self._pending = None
+                return False
+            if fingerprint != self._pending:
+                self._pending = fingerprint
+                return False
+
+            try:
+                if self.current is not None and content_version(self.artifacts_dir, self.files) == self.current.version:
+                    self._fingerprint = fingerprint
+                    return False
+                artifacts = load_artifacts(self.artifacts_dir, self.use_table, self.compact, self.mmap, self.trees)
+                validate_artifacts(artifacts)
+            except Exception as e:
+                self.last_error = str(e)
+                self._fingerprint = fingerprint
+                print(f"❌ Artifact reload failed, keeping version {self.version}: {e}")
+                return False
+
+            if stat_fingerprint(self.artifacts_dir, self.files) != fingerprint:
+                return False
+            self._publish(artifacts, fingerprint)
+            return True
+
+    def on_swap(self, listener):
+        """Call listener(artifacts) after every newly published set (cache invalidation)"""
+        self._listeners.append(listener)
+
+    def _publish(self, artifacts, fingerprint):
+        self.current = artifacts
+        for listener in self._listeners:
+            listener(artifacts)
+        self._fingerprint = fingerprint
+        self._pending = None
+        self.last_error = None
+        self.swaps += 1
+        if artifacts.model is not None:
+            print(f"✅ Model loaded successfully (version {artifacts.version})")
+        else:
+            print("⚠️ Model not found, using fallback prediction")
+        if artifacts.table is not None:
+            print(f"✅ Prediction table built: {artifacts.table.values.shape}")
+
+    @property
+    def version(self):
+        return self.current.version if self.current is not None else None
+
+    def status(self):
+        current = self.current
+        return {
+            "version": self.version,
+            "loaded_at": current.loaded_at if current is not None else None,
+            "model_name": current.metadata.get("model_name") if current is not None else None,
+            "format": current.metadata.get("format", "pickle") if current is not None else None,
+            "feature_cols": current.metadata.get("feature_cols") if current is not None else None,
+            "prediction_table": current is not None and current.table is not None,
+            "swaps": self.swaps,
+            "watching": self._thread is not None and self._thread.is_alive(),
+            "last_error": self.last_error,
+        }
+
+    def start(self):
+        """Poll the artifacts directory in a daemon thread"""
+        if self.poll_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="artifact-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def preload(self):
+        """
+        Pre-fork hook: load the artifacts once in the master and stop watching
+        there (each worker calls start() after fork). Everything allocated so
+        far is moved into gc's permanent generation so collections in the
+        workers do not write to, and thereby copy, the shared pages.
+        """
+        if self.current is None:
+            self.reload()
+        self.stop()
+        gc.freeze()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Artifact watcher error: {e}")
@@ -0,0 +1,91 @@
+"""
+Route list for /api/routes.
+
+Built once and kept until its source changes: the dataset CSV (checked by
+mtime/size on each call, which is a single stat) or, when no CSV is found,
+the active model's le_route.classes_. Each build carries an ETag and a
+Last-Modified time so clients can revalidate with a 304.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+
+
+DEFAULT_ROUTES = ["R1", "R2", "R3", "R4"]
+
+RouteList = namedtuple("RouteList", ["routes", "etag", "last_modified", "source"])
+
+
+def read_csv_routes(csv_path):
+    # pandas is only needed here, keep it out of worker startup
+    import pandas as pd
+
+    df = pd.read_csv(csv_path, usecols=lambda col: col == "route_id")
+    if "route_id" not in df.columns:
+        print("⚠️ route_id column not found")
+        return None
+    return sorted(df["route_id"].dropna().unique().tolist())
+
+
+class RouteIndex:
+    def __init__(self, csv_paths, artifacts_source=None):
+        self.csv_paths = csv_paths
+        # Callable returning the active Artifacts, used when the CSV is missing
+        self.artifacts_source = artifacts_source
+        self._key = None
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def _source_key(self):
+        for path in self.csv_paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            return ("csv", path, st.st_mtime_ns, st.st_size)
+        artifacts = self.artifacts_source() if self.artifacts_source is not None else None
+        if artifacts is not None and artifacts.le_route is not None:
+            return ("model", artifacts.version, artifacts.loaded_at)
+        return ("default",)
+
+    def get(self):
+        key = self._source_key()
+        entry = self._entry
+        if entry is not None and key == self._key:
+            return entry
+        with self._lock:
+            if self._entry is None or key != self._key:
+                self._entry = self._build(key)
+                self._key = key
+            return self._entry
+
+    def _build(self, key):
+        routes = None
+        modified = None
+        if key[0] == "csv":
+            try:
+                routes = read_csv_routes(key[1])
+                modified = key[2] / 1e9
+                if routes is not None:
+                    print(f"✅ Loaded {len(routes)} routes from CSV")
+            except Exception as e:
+                print(f"❌ Error reading routes: {str(e)}")
+        elif key[0] == "model":
+            print("⚠️ CSV not found, using the model's route classes")
+            routes = [str(r) for r in self.artifacts_source().le_route.classes_]
+            modified = key[2]
+        else:
+            print("⚠️ CSV not found, using default routes")
+
+        if routes is None:
+            routes = list(DEFAULT_ROUTES)
+        body = json.dumps(routes, sort_keys=True).encode()
+        return RouteList(
+            routes=routes,
+            etag=hashlib.sha1(body).hexdigest()[:16],
+            last_modified=datetime.fromtimestamp(modified, tz=timezone.utc) if modified else None,
+            source=key[0],
+        )
@@ -0,0 +1,260 @@
+"""
+Offline bulk scoring: a trip file in, the same file with predictions out.
+
+    python score.py trips.csv scored.csv [--workers 4] [--chunk-size 100000]
+
+Loads the artifacts predict_server.py serves (same ARTIFACTS_DIR /
+ARTIFACTS_FORMAT / PREDICT_TABLE settings), and applies the rules of
+featurize(): route/weather defaults and normalization, the peak window and
+unknown labels encoded as 0. Those string rules run once per distinct value
+in a chunk, and the result is broadcast back to every row. Encoding and the
+model call are vectorized over the whole chunk.
+
+The hour comes from an hour_of_day column when the file has one. Otherwise
+it comes from scheduled_time: full timestamps ("2024-02-02 13:50:00", the
+training CSV format) are parsed as datetimes, and anything else ("HH:MM")
+goes through featurize()'s hour parsing.
+
+The input is read in chunks and each chunk is scored in a worker process.
+Results are appended to the output in input order. At most 2 x workers
+chunks are in flight, so memory stays bounded whatever the file size.
+Every input column is kept unchanged. The output adds
+predicted_delay_minutes (rounded like the API), predicted_status and
+confidence. confidence is only added when the artifacts have an interval
+model (see uncertainty.py).
+
+CSV is always supported. Parquet input/output (.parquet) needs pyarrow.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from inference import (
+    ARTIFACTS_DIR,
+    DEFAULT_HOUR,
+    InferenceEngine,
+    normalize_route,
+    normalize_weather,
+    trip_hour,
+)
+
+
+CHUNK_ROWS = 100_000
+TRIP_COLS = ["route_id", "scheduled_time", "weather", "hour_of_day"]
+# scheduled_time values that carry a date are timestamps, not "HH:MM"
+DATE_PREFIX = r"^\s*\d{4}-\d{1,2}-\d{1,2}"
+STATUSES = np.array(["On Time", "Minor Delay", "Moderate Delay", "High Delay"], dtype=object)
+
+
+def per_unique(values, fn, dtype=object):
+    """fn applied once per distinct value, broadcast back to every row"""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    mapped = np.array([fn(None if pd.isna(u) else u) for u in uniques], dtype=dtype)
+    return mapped[codes]
+
+
+def delay_statuses(delays):
+    """Vectorized delay_status()"""
+    return STATUSES[(delays > 0).astype(np.int8) + (delays > 5) + (delays > 10)]
+
+
+def trip_hours(scheduled, hour_column):
+    """Hour per row: a numeric hour_of_day wins, then timestamps, then trip_hour() for "HH:MM" values"""
+    text = pd.Series(scheduled, dtype=object)
+    dated = text.str.match(DATE_PREFIX, na=False).to_numpy()
+    hours = np.empty(len(text), dtype=np.int64)
+    if dated.any():
+        parsed = pd.to_datetime(text[dated], errors="coerce", format="ISO8601")
+        hours[dated] = parsed.dt.hour.fillna(DEFAULT_HOUR).to_numpy(dtype=np.int64)
+    if not dated.all():
+        hours[~dated] = per_unique(scheduled[~dated], trip_hour, dtype=np.int64)
+
+    given = pd.to_numeric(pd.Series(hour_column, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+    usable = ~np.isnan(given)
+    hours[usable] = given[usable].astype(np.int64)
+    return hours
+
+
+def score_columns(engine, routes, scheduled, weathers, hour_column):
+    """Raw trip columns -> (hours, is_peak, delays, statuses, confidences or None) for every row"""
+    routes = per_unique(routes, normalize_route)
+    weathers = per_unique(weathers, normalize_weather)
+    hours = trip_hours(scheduled, hour_column)
+
+    artifacts = engine.artifacts
+    features, hours, is_peak = engine.featurize_normalized(routes, weathers, hours, artifacts)
+    delays = np.asarray(engine.predict_delays(features, is_peak, weathers, artifacts), dtype=np.float64)
+    confidences = engine.confidences(features, delays, artifacts)
+    return hours, is_peak, delays, delay_statuses(delays), confidences
+
+
+# Worker state, set once per process by _init_worker
+_worker = {}
+
+
+def _init_worker(engine_kwargs, single_threaded):
+    engine = InferenceEngine(poll_interval=0, **engine_kwargs)
+    artifacts = engine.artifacts
+    models = [artifacts.model] + (artifacts.quantiles["models"] if artifacts.quantiles is not None else [])
+    for model in models:
+        if single_threaded and hasattr(model, "set_params"):
+            # The pool supplies the parallelism; one thread per process avoids oversubscription
+            model.set_params(n_jobs=1)
+    _worker["engine"] = engine
+
+
+def _score_chunk(columns):
+    return score_columns(_worker["engine"], *columns)
+
+
+def trip_columns(chunk):
+    """The columns the features come from; a missing column behaves like a missing payload key"""
+    columns = []
+    for col in TRIP_COLS:
+        if col not in chunk.columns:
+            columns.append(np.full(len(chunk), None, dtype=object))
+        elif pd.api.types.is_datetime64_any_dtype(chunk[col]):
+            # Parquet timestamps, as the text the CSV path would read
+            columns.append(chunk[col].dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object))
+        else:
+            columns.append(chunk[col].to_numpy(dtype=object))
+    return tuple(columns)
+
+
+def require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet
+    except ImportError:
+        sys.exit("❌ Parquet files need pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def read_chunks(path, chunk_size):
+    if path.endswith(".parquet"):
+        require_pyarrow()
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+        return
+    # Everything as text, empty cells as "" (falls back to the defaults like an empty JSON field)
+    yield from pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size)
+
+
+class ChunkWriter:
+    """Appends scored chunks to a CSV, or a Parquet file when the path ends in .parquet"""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self._writer = None
+        self._header = True
+        if self.parquet:
+            require_pyarrow()
+
+    def write(self, chunk):
+        if not self.parquet:
+            chunk.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def with_predictions(chunk, result):
+    """The input columns as read, plus the predictions in columns of their own"""
+    _, _, delays, statuses, confidences = result
+    chunk = chunk.copy()
+    chunk["predicted_delay_minutes"] = np.round(delays, 1)
+    chunk["predicted_status"] = statuses
+    if confidences is not None:
+        chunk["confidence"] = confidences
+    return chunk
+
+
+def score_file(in_path, out_path, engine_kwargs, chunk_size=CHUNK_ROWS, workers=None):
+    """Stream in_path through the model into out_path -> (rows, seconds)"""
+    workers = workers or os.cpu_count() or 1
+    writer = ChunkWriter(out_path)
+    rows = 0
+    start = time.perf_counter()
+
+    def done(chunk, result):
+        nonlocal rows
+        writer.write(with_predictions(chunk, result))
+        rows += len(chunk)
+        elapsed = time.perf_counter() - start
+        print(f"   {rows:,} rows ({rows / elapsed:,.0f} rows/s)", file=sys.stderr)
+
+    try:
+        if workers == 1:
+            _init_worker(engine_kwargs, single_threaded=False)
+            for chunk in read_chunks(in_path, chunk_size):
+                done(chunk, _score_chunk(trip_columns(chunk)))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(engine_kwargs, True),
+            ) as pool:
+                pending = deque()
+                for chunk in read_chunks(in_path, chunk_size):
+                    pending.append((chunk, pool.submit(_score_chunk, trip_columns(chunk))))
+                    if len(pending) >= 2 * workers:
+                        chunk, future = pending.popleft()
+                        done(chunk, future.result())
+                while pending:
+                    chunk, future = pending.popleft()
+                    done(chunk, future.result())
+    finally:
+        writer.close()
+    return rows, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a trip CSV/Parquet file with the delay model")
+    parser.add_argument("input", help="trips with route_id, scheduled_time, weather (.csv or .parquet)")
+    parser.add_argument("output", help="where to write the scored trips (.csv or .parquet)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_ROWS, help="rows per chunk")
+    parser.add_argument("--workers", type=int, default=None, help="scoring processes (default: all cores)")
+    parser.add_argument("--artifacts-dir", default=ARTIFACTS_DIR)
+    parser.add_argument(
+        "--format",
+        choices=["pickle", "compact", "trees"],
+        default=os.environ.get("ARTIFACTS_FORMAT", "pickle"),
+        help="artifact format to load, as ARTIFACTS_FORMAT for the servers",
+    )
+    parser.add_argument(
+        "--table",
+        action="store_true",
+        default=os.environ.get("PREDICT_TABLE", "0") == "1",
+        help="score from the precomputed prediction table, as PREDICT_TABLE=1",
+    )
+    args = parser.parse_args()
+
+    engine_kwargs = {
+        "artifacts_dir": args.artifacts_dir,
+        "use_table": args.table,
+        "compact": args.format == "compact",
+        "trees": args.format == "trees",
+        # Workers share the artifact arrays instead of each loading a copy
+        "mmap": True,
+    }
+    rows, seconds = score_file(args.input, args.output, engine_kwargs, args.chunk_size, args.workers)
+    print(f"✅ Scored {rows:,} trips in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/s) -> {args.output}")
@@ -0,0 +1,181 @@
+"""
+Parallel hyperparameter search for train.py (--search).
+
+Every (candidate, fold) fit is a task on a process pool sized to the
+machine. The training matrix is written once to .npy files, and each
+worker memory-maps them read-only in its initializer, so tasks carry only
+a candidate index and a fold number. A task never ships a copy of the data.
+Each fit runs single-threaded, and the parallelism comes from the pool.
+
+XGBoost candidates stop early on a slice held out from each fold's
+training rows. Their refit uses the mean best iteration across folds as
+n_estimators. Random forests have no early-stopping analogue, so they fit
+their full size.
+"""
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error
+
+
+# Upper bound for boosted rounds; early stopping picks the real count
+XGB_MAX_ROUNDS = 1000
+XGB_EARLY_STOPPING = 20
+# Fraction of each fold's training rows used for early stopping
+EARLY_STOPPING_FRACTION = 0.1
+
+CANDIDATES = [
+    {"family": "xgboost", "params": {"max_depth": 3, "learning_rate": 0.1}},
+    {"family": "xgboost", "params": {"max_depth": 6, "learning_rate": 0.1}},
+    {"family": "xgboost", "params": {"max_depth": 8, "learning_rate": 0.05}},
+    {"family": "random_forest", "params": {"n_estimators": 100, "max_depth": None}},
+    {"family": "random_forest", "params": {"n_estimators": 300, "max_depth": None}},
+    {"family": "random_forest", "params": {"n_estimators": 300, "max_depth": 12, "min_samples_leaf": 5}},
+]
+
+
+def xgboost_available():
+    try:
+        import xgboost  # noqa: F401
+    except Exception:
+        return False
+    return True
+
+
+def build_model(candidate, n_estimators=None, early_stopping=False, n_jobs=1):
+    params = dict(candidate["params"])
+    if candidate["family"] == "xgboost":
+        import xgboost as xgb
+
+        return xgb.XGBRegressor(
+            n_estimators=n_estimators or XGB_MAX_ROUNDS,
+            early_stopping_rounds=XGB_EARLY_STOPPING if early_stopping else None,
+            random_state=42,
+            verbosity=0,
+            n_jobs=n_jobs,
+            **params,
+        )
+    return RandomForestRegressor(random_state=42, n_jobs=n_jobs, **params)
+
+
+def fold_indices(n_rows, folds, fold, seed=42):
+    """Shuffled k-fold split, recomputed in each worker instead of shipped"""
+    order = np.random.default_rng(seed).permutation(n_rows)
+    test = order[fold::folds]
+    mask = np.ones(n_rows, dtype=bool)
+    mask[test] = False
+    return order[mask[order]], np.sort(test)
+
+
+# Worker state, set once per process by _init_worker
+_shared = {}
+
+
+def _init_worker(x_path, y_path, candidates, folds):
+    _shared["X"] = np.load(x_path, mmap_mode="r")
+    _shared["y"] = np.load(y_path, mmap_mode="r")
+    _shared["candidates"] = candidates
+    _shared["folds"] = folds
+
+
+def _fit_fold(task):
+    candidate_no, fold = task
+    X, y = _shared["X"], _shared["y"]
+    candidate = _shared["candidates"][candidate_no]
+    train_rows, test_rows = fold_indices(len(y), _shared["folds"], fold)
+
+    start = time.perf_counter()
+    if candidate["family"] == "xgboost":
+        n_stop = max(1, int(len(train_rows) * EARLY_STOPPING_FRACTION))
+        fit_rows, stop_rows = train_rows[:-n_stop], train_rows[-n_stop:]
+        model = build_model(candidate, early_stopping=True)
+        model.fit(X[fit_rows], y[fit_rows], eval_set=[(X[stop_rows], y[stop_rows])], verbose=False)
+        best_iteration = int(model.best_iteration)
+    else:
+        model = build_model(candidate)
+        model.fit(X[train_rows], y[train_rows])
+        best_iteration = None
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    preds = model.predict(X[test_rows])
+    predict_seconds = time.perf_counter() - start
+    return {
+        "candidate": candidate_no,
+        "fold": fold,
+        "mae": float(mean_absolute_error(y[test_rows], preds)),
+        "fit_seconds": fit_seconds,
+        "predict_seconds": predict_seconds,
+        "best_iteration": best_iteration,
+    }
+
+
+def search(X, y, candidates=None, folds=5, workers=None):
+    """
+    k-fold CV of every candidate over a process pool.
+
+    Returns (best, summary). summary["candidates"] has one entry per
+    candidate, sorted by mean CV MAE, with per-fold MAE and timings; best is
+    its first entry.
+    """
+    if candidates is None:
+        candidates = [c for c in CANDIDATES if c["family"] != "xgboost" or xgboost_available()]
+    workers = workers or os.cpu_count() or 1
+    tasks = [(i, fold) for i in range(len(candidates)) for fold in range(folds)]
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="train-search-") as tmp_dir:
+        x_path = os.path.join(tmp_dir, "X.npy")
+        y_path = os.path.join(tmp_dir, "y.npy")
+        np.save(x_path, np.ascontiguousarray(X))
+        np.save(y_path, np.ascontiguousarray(y))
+
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)),
+            initializer=_init_worker,
+            initargs=(x_path, y_path, candidates, folds),
+        ) as pool:
+            fold_results = list(pool.map(_fit_fold, tasks))
+    wall_seconds = time.perf_counter() - start
+
+    results = []
+    for i, candidate in enumerate(candidates):
+        runs = [r for r in fold_results if r["candidate"] == i]
+        maes = [r["mae"] for r in runs]
+        iterations = [r["best_iteration"] for r in runs if r["best_iteration"] is not None]
+        results.append(
+            {
+                "family": candidate["family"],
+                "params": candidate["params"],
+                "cv_mae": float(np.mean(maes)),
+                "cv_mae_std": float(np.std(maes)),
+                "fold_mae": maes,
+                "fit_seconds": float(sum(r["fit_seconds"] for r in runs)),
+                "predict_seconds": float(sum(r["predict_seconds"] for r in runs)),
+                "best_iteration": int(np.mean(iterations)) if iterations else None,
+            }
+        )
+    results.sort(key=lambda r: r["cv_mae"])
+    summary = {
+        "folds": folds,
+        "workers": min(workers, len(tasks)),
+        "wall_seconds": wall_seconds,
+        "candidates": results,
+    }
+    return results[0], summary
+
+
+def refit_best(best, X, y, n_jobs=None):
+    """Fit the winning candidate on all training rows, with its CV-chosen size"""
+    n_estimators = None
+    if best["family"] == "xgboost":
+        n_estimators = best["best_iteration"] + 1
+    model = build_model(best, n_estimators=n_estimators, n_jobs=n_jobs or os.cpu_count() or 1)
+    model.fit(X, y)
+    # All cores for the fit only: the saved model serves from many workers at once
+    model.set_params(n_jobs=1)
+    return model
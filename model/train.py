@@ -7,110 +7,440 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import mean_absolute_error, r2_score
 
+from compact import atomic_write
+from dataset_cache import cache_key, load_cached, save_cache
+from prediction_table import peak_mask
+from search import refit_best, search
+from trees import distinct_rows
+from uncertainty import (
+    QUANTILES_FILE,
+    calibrate_confidence,
+    calibrate_margin,
+    confidence,
+    fit_quantile_boosters,
+    interval_model,
+    widen,
+    within_tolerance,
+)
 
-def train_model():
-    csv_path = os.path.join(os.path.dirname(__file__), "cleaned_transport_data (2).csv")
-    if not os.path.exists(csv_path):
-        print(f"Error: Dataset not found at {csv_path}")
-        return
 
-    print("Loading Dataset...")
-    df = pd.read_csv(csv_path)
+def dump_atomic(obj, path):
+    with atomic_write(path) as f:
+        joblib.dump(obj, f)
 
-    # --- Feature Selection & Engineering ---
-    # The dataset appears to be already cleaned and has features, but we need to ensure consistent encoding.
 
-    # 1. Route Encoding
-    le_route = LabelEncoder()
-    # Normalize route just in case
-    df["route_id"] = df["route_id"].astype(str).str.upper().str.strip()
-    df["route_code"] = le_route.fit_transform(df["route_id"])
+# Rows per read_csv chunk; only the encoded feature columns are kept in memory
+CHUNK_ROWS = 1_000_000
+FEATURE_COLS = ["hour_of_day", "is_peak_hour", "weather_code", "route_code"]
+TARGET_COL = "delay_minutes"
+# Bump when the cleaning/encoding rules below change, so cached datasets are rebuilt
+DATASET_SPEC = {"version": 1, "features": FEATURE_COLS, "target": TARGET_COL}
+DATASET_CACHE_DIR = os.path.join(os.path.dirname(__file__), "dataset_cache")
+ARTIFACTS_OUT = "model/artifacts"
+# Boosting rounds / forest trees added per incremental run
+INCREMENT_TREES = 50
 
-    # 2. Weather Encoding
-    le_weather = LabelEncoder()
-    df["weather"] = df["weather"].astype(str).str.lower().str.strip()
-    df["weather_code"] = le_weather.fit_transform(df["weather"])
 
-    # 3. Time Features
-    # Ensure hour_of_day exists, otherwise create it
-    # 3. Time Features
-    # Ensure hour_of_day exists, otherwise create it
-    try:
-        # parsed with errors='coerce' turns unparseable data into NaT
-        df["scheduled_time"] = pd.to_datetime(df["scheduled_time"], errors="coerce")
-        if "hour_of_day" not in df.columns:
-            df["hour_of_day"] = df["scheduled_time"].dt.hour
-    except Exception as e:
-        print(f"Error parsing dates: {e}")
-        return
+def encoder_from_classes(classes):
+    encoder = LabelEncoder()
+    encoder.classes_ = np.asarray(classes, dtype=object)
+    return encoder
+
 
-    # Drop rows where time could not be parsed
-    df = df.dropna(subset=["hour_of_day"])
+class LabelUnion:
+    """Grows label -> id over all chunks (first-seen order), normalizing each category once"""
 
-    # 4. Peak Hour
-    if "is_peak_hour" not in df.columns:
-        df["is_peak_hour"] = df["hour_of_day"].apply(
-            lambda h: 1 if (7 <= h <= 9 or 16 <= h <= 19) else 0
+    def __init__(self, normalize):
+        self.normalize = normalize
+        self.ids = {}
+
+    def chunk_ids(self, column):
+        # Categorical column -> global id per row; missing values become the
+        # label astype(str) gives them ("nan"), like the in-memory path did
+        labels = [self.normalize(str(c)) for c in column.cat.categories]
+        codes = column.cat.codes.to_numpy()
+        if (codes < 0).any():
+            labels.append(self.normalize("nan"))
+        lookup = np.array(
+            [self.ids.setdefault(label, len(self.ids)) for label in labels],
+            dtype=np.int32,
         )
+        # code -1 (missing) indexes the "nan" label appended last
+        return lookup[codes]
+
+    def fit_encoder(self, base=None):
+        """
+        LabelEncoder over the union, plus the global id -> encoded code map.
+        With a base encoder its codes are kept and unseen labels are appended
+        after them, so classes_ is no longer sorted (serving's
+        FastLabelEncoder and sklearn's object-dtype lookup both allow that).
+        """
+        labels = list(self.ids)
+        if base is None:
+            encoder = LabelEncoder().fit(np.array(labels, dtype=object))
+        else:
+            known = set(base.classes_)
+            new_labels = sorted(label for label in labels if label not in known)
+            encoder = encoder_from_classes(list(base.classes_) + new_labels)
+        code = {label: i for i, label in enumerate(encoder.classes_)}
+        return encoder, np.array([code[label] for label in labels], dtype=np.int64)
+
+
+def read_chunks(csv_path, chunk_size=CHUNK_ROWS):
+    """(hour int8, is_peak int8, weather id, route id, delay float32) per chunk, NaN rows dropped"""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    has_hour = "hour_of_day" in header
+    has_peak = "is_peak_hour" in header
+
+    usecols = ["route_id", "weather", TARGET_COL]
+    usecols.append("hour_of_day" if has_hour else "scheduled_time")
+    if has_peak:
+        usecols.append("is_peak_hour")
+    dtype = {
+        "route_id": "category",
+        "weather": "category",
+        "hour_of_day": "float32",
+        "is_peak_hour": "float32",
+        TARGET_COL: "float32",
+    }
+
+    routes = LabelUnion(lambda r: r.upper().strip())
+    weathers = LabelUnion(lambda w: w.lower().strip())
+
+    def chunks():
+        for chunk in pd.read_csv(csv_path, usecols=usecols, dtype=dtype, chunksize=chunk_size):
+            if has_hour:
+                hours = chunk["hour_of_day"].to_numpy()
+            else:
+                # errors='coerce' turns unparseable times into NaT -> NaN hour
+                scheduled = pd.to_datetime(chunk["scheduled_time"], errors="coerce")
+                hours = scheduled.dt.hour.to_numpy(dtype=np.float32, na_value=np.nan)
+            delays = chunk[TARGET_COL].to_numpy()
+            keep = ~np.isnan(hours) & ~np.isnan(delays)
+            if has_peak:
+                peaks = chunk["is_peak_hour"].to_numpy()
+                keep &= ~np.isnan(peaks)
+            else:
+                peaks = peak_mask(hours)
+
+            yield (
+                hours[keep].astype(np.int8),
+                peaks[keep].astype(np.int8),
+                weathers.chunk_ids(chunk["weather"])[keep],
+                routes.chunk_ids(chunk["route_id"])[keep],
+                delays[keep],
+            )
+
+    return chunks(), routes, weathers
 
-    # Features to use for training
-    # Note: We rely on what the user Inputs from Frontend: Route, Weather, Time -> we derive the rest.
-    feature_cols = ["hour_of_day", "is_peak_hour", "weather_code", "route_code"]
-    target_col = "delay_minutes"
 
-    # Ensure all features exist and drop any remaining NaNs (better than filling with 0)
-    df = df.dropna(subset=feature_cols + [target_col])
+def load_training_data(csv_path, chunk_size=CHUNK_ROWS, le_route=None, le_weather=None):
+    """
+    Streams the CSV into a compact (n, 4) feature matrix in FEATURE_COLS order.
 
-    X = df[feature_cols]
-    y = df[target_col]
+    Chunks carry categoricals and small ints, never the full string frame.
+    Route/weather labels are normalized per category rather than per row,
+    and the encoders are fitted on the union of labels once every chunk is
+    seen, then the per-chunk ids are remapped to the final codes. Passing
+    the current encoders extends them instead (see LabelUnion.fit_encoder).
+    """
+    chunks, routes, weathers = read_chunks(csv_path, chunk_size)
+    parts = list(chunks)
+
+    le_route, route_codes = routes.fit_encoder(le_route)
+    le_weather, weather_codes = weathers.fit_encoder(le_weather)
+
+    n_rows = sum(len(part[4]) for part in parts)
+    largest = max(len(le_route.classes_), len(le_weather.classes_), 24)
+    X = np.empty((n_rows, len(FEATURE_COLS)), dtype=np.promote_types(np.int8, np.min_scalar_type(largest)))
+    y = np.empty(n_rows, dtype=np.float32)
+
+    start = 0
+    for i in range(len(parts)):
+        hours, peaks, weather_ids, route_ids, delays = parts[i]
+        parts[i] = None
+        end = start + len(delays)
+        X[start:end, 0] = hours
+        X[start:end, 1] = peaks
+        X[start:end, 2] = weather_codes[weather_ids]
+        X[start:end, 3] = route_codes[route_ids]
+        y[start:end] = delays
+        start = end
+
+    return X, y, le_route, le_weather
+
+
+def load_dataset(csv_path, chunk_size=CHUNK_ROWS, cache_dir=DATASET_CACHE_DIR):
+    """
+    load_training_data() behind the dataset cache: a hit memory-maps the
+    encoded matrix instead of parsing the CSV. cache_dir=None disables it.
+    """
+    if cache_dir is None:
+        return load_training_data(csv_path, chunk_size)
+
+    key = cache_key(csv_path, DATASET_SPEC)
+    cached = load_cached(cache_dir, csv_path, key)
+    if cached is not None:
+        X, y, route_classes, weather_classes = cached
+        print(f"Loaded cached dataset {key} ({len(y)} rows)")
+        return X, y, encoder_from_classes(route_classes), encoder_from_classes(weather_classes)
+
+    print(f"Loading Dataset in chunks of {chunk_size} rows...")
+    X, y, le_route, le_weather = load_training_data(csv_path, chunk_size)
+    path = save_cache(cache_dir, csv_path, key, X, y, le_route.classes_, le_weather.classes_)
+    print(f"Cached encoded dataset at {path}")
+    return X, y, le_route, le_weather
+
+
+def train_model(
+    chunk_size=CHUNK_ROWS,
+    cache_dir=DATASET_CACHE_DIR,
+    preprocess_only=False,
+    search_mode=False,
+    folds=5,
+    workers=None,
+):
+    csv_path = os.path.join(os.path.dirname(__file__), "cleaned_transport_data (2).csv")
+    if not os.path.exists(csv_path):
+        print(f"Error: Dataset not found at {csv_path}")
+        return
+
+    try:
+        X, y, le_route, le_weather = load_dataset(csv_path, chunk_size, cache_dir)
+    except Exception as e:
+        print(f"Error reading dataset: {e}")
+        return
+    if preprocess_only:
+        return
 
-    # Handle NaN - we already dropped them, but just in case
-    # X = X.fillna(0)  <-- Removing this generic zero-fill which caused issues
+    # Features to use for training
+    # Note: We rely on what the user Inputs from Frontend: Route, Weather, Time -> we derive the rest.
+    feature_cols = FEATURE_COLS
 
-    print(f"Training on {len(df)} records with features: {feature_cols}")
+    print(f"Training on {len(y)} records with features: {feature_cols}")
 
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42
     )
 
-    # Try XGBoost first for better performance; fall back to RandomForest if not available
-    try:
-        import xgboost as xgb
+    search_summary = None
+    if search_mode:
+        print(f"Searching {folds}-fold CV over the candidate models...")
+        best, search_summary = search(X_train, y_train, folds=folds, workers=workers)
+        for result in search_summary["candidates"]:
+            print(
+                f"  {result['family']} {result['params']}: "
+                f"CV MAE {result['cv_mae']:.2f} ± {result['cv_mae_std']:.2f} "
+                f"({result['fit_seconds']:.1f}s fitting)"
+            )
+        print(f"Refitting best candidate: {best['family']} {best['params']}")
+        model = refit_best(best, X_train, y_train)
+        model_name = best["family"]
+    else:
+        # Try XGBoost first for better performance; fall back to RandomForest if not available
+        try:
+            import xgboost as xgb
 
-        print("Training XGBoost Regressor...")
-        model = xgb.XGBRegressor(n_estimators=200, random_state=42, verbosity=0)
-        model.fit(X_train, y_train)
-        model_name = "xgboost"
-    except Exception as e:
-        print(
-            "XGBoost not available or failed, falling back to RandomForest. Error:", e
-        )
-        print("Training Random Forest Regressor...")
-        model = RandomForestRegressor(n_estimators=100, random_state=42)
-        model.fit(X_train, y_train)
-        model_name = "random_forest"
+            print("Training XGBoost Regressor...")
+            model = xgb.XGBRegressor(n_estimators=200, random_state=42, verbosity=0)
+            model.fit(X_train, y_train)
+            model_name = "xgboost"
+        except Exception as e:
+            print(
+                "XGBoost not available or failed, falling back to RandomForest. Error:", e
+            )
+            print("Training Random Forest Regressor...")
+            model = RandomForestRegressor(n_estimators=100, random_state=42)
+            model.fit(X_train, y_train)
+            model_name = "random_forest"
 
     preds = model.predict(X_test)
     mae = mean_absolute_error(y_test, preds)
     r2 = r2_score(y_test, preds)
     print(f"Model Results -> MAE: {mae:.2f} min, R2: {r2:.2f}")
 
-    # Save Artifacts
-    if not os.path.exists("model/artifacts"):
-        os.makedirs("model/artifacts")
+    # Boosted trees have no spread of their own: fit the q10/q90 boosters for confidence
+    quantiles = None
+    if hasattr(model, "get_booster"):
+        print("Training XGBoost quantile models for the delay interval...")
+        quantiles = fit_quantile_boosters(model.get_params(), X_train, y_train)
 
-    joblib.dump(model, "model/artifacts/model.pkl")
     # Save a small metadata file
-    joblib.dump(
-        {"model_name": model_name, "feature_cols": feature_cols},
-        "model/artifacts/metadata.pkl",
+    metadata = {"model_name": model_name, "feature_cols": feature_cols}
+    metadata.update(calibrate_interval(model, quantiles, X_test, y_test))
+    if search_summary is not None:
+        # Per-candidate CV MAE and timings, best first
+        metadata["search"] = search_summary
+    save_artifacts(model, metadata, le_route, le_weather, quantiles=quantiles)
+
+
+def calibrate_interval(model, quantiles, X_test, y_test):
+    """
+    Calibrate the [q10, q90] interval and the confidence on half of the
+    held-out rows and measure both on the other half -> {"interval_margin",
+    "interval_coverage", "confidence_calibration"}, or {} when the model
+    has no interval
+    """
+    interval = interval_model(model, quantiles, margin=0.0)
+    if interval is None:
+        return {}
+    # Held-out rows repeat a small feature domain: score each distinct row once
+    rows, inverse = distinct_rows(X_test)
+    bounds = interval.predict(rows)[inverse]
+    delays = np.asarray(model.predict(model_input(model, rows)), dtype=np.float64)[inverse]
+    y_test = np.asarray(y_test, dtype=np.float64)
+    # Alternate rows, so both halves see the same mix of routes and hours
+    fit, check = slice(0, None, 2), slice(1, None, 2)
+
+    margin = calibrate_margin(bounds[fit], y_test[fit], interval.alphas)
+    raw = float(np.mean((y_test[check] >= bounds[check, 0]) & (y_test[check] <= bounds[check, -1])))
+    bounds = widen(bounds, margin)
+    coverage = float(np.mean((y_test[check] >= bounds[check, 0]) & (y_test[check] <= bounds[check, -1])))
+    print(
+        f"Delay interval covers {coverage:.0%} of held-out trips after a {margin:.1f} min margin "
+        f"({raw:.0%} before, target {interval.alphas[-1] - interval.alphas[0]:.0%})"
     )
+
+    calibration = calibrate_confidence(delays[fit], bounds[fit], y_test[fit])
+    hit_rate = float(np.mean(within_tolerance(delays[check], y_test[check])))
+    mean_raw = float(np.mean(confidence(delays[check], bounds[check])))
+    mean_calibrated = float(np.mean(confidence(delays[check], bounds[check], calibration)))
+    print(
+        f"Mean confidence {mean_calibrated:.0f} against {hit_rate:.0%} of held-out trips within tolerance "
+        f"({mean_raw:.0f} uncalibrated)"
+    )
+    return {"interval_margin": margin, "interval_coverage": coverage, "confidence_calibration": calibration}
+
+
+def save_artifacts(model, metadata, le_route, le_weather, artifacts_dir=ARTIFACTS_OUT, quantiles=None):
+    if not os.path.exists(artifacts_dir):
+        os.makedirs(artifacts_dir)
+
+    quantiles_path = os.path.join(artifacts_dir, QUANTILES_FILE)
+    if quantiles is not None:
+        dump_atomic(quantiles, quantiles_path)
+    elif os.path.exists(quantiles_path):
+        # Left over from an earlier XGBoost model, it would not match this one
+        os.remove(quantiles_path)
+    dump_atomic(model, os.path.join(artifacts_dir, "model.pkl"))
+    dump_atomic(metadata, os.path.join(artifacts_dir, "metadata.pkl"))
     # Save encoders to map inputs correctly during prediction
-    joblib.dump(le_route, "model/artifacts/le_route.pkl")
-    joblib.dump(le_weather, "model/artifacts/le_weather.pkl")
+    dump_atomic(le_route, os.path.join(artifacts_dir, "le_route.pkl"))
+    dump_atomic(le_weather, os.path.join(artifacts_dir, "le_weather.pkl"))
+
+    print(f"Model and Encoders saved to {artifacts_dir}/")
+
+    # NumPy-only copy for fast-starting workers (ARTIFACTS_FORMAT=compact)
+    from compact import export_compact
+
+    print(f"Compact artifacts saved to {export_compact(artifacts_dir)}")
+
+    # The trees themselves as flat arrays, for the NumPy evaluator (ARTIFACTS_FORMAT=trees)
+    from trees import export_trees
+
+    print(f"Tree arrays saved to {export_trees(artifacts_dir)}")
 
-    print("Model and Encoders saved to model/artifacts/")
+
+def model_input(model, X):
+    """X the way model was fitted: models from the old train.py were fitted on a DataFrame and check its names"""
+    if getattr(model, "feature_names_in_", None) is not None:
+        return pd.DataFrame(X, columns=FEATURE_COLS)
+    return X
+
+
+def continue_training(model, X, y, add_trees):
+    """Grow the trained model on new rows: more boosting rounds, or more forest trees"""
+    if hasattr(model, "get_booster"):
+        # XGBoost: n_estimators is the number of rounds added on top of the booster
+        booster = model.get_booster()
+        model.set_params(n_estimators=add_trees)
+        model.fit(X, y, xgb_model=booster)
+    else:
+        # RandomForest: warm_start keeps the fitted trees and fits only the new ones
+        model.set_params(warm_start=True, n_estimators=model.n_estimators + add_trees)
+        model.fit(X, y)
+    return model
+
+
+def train_incremental(csv_path, add_trees=INCREMENT_TREES, chunk_size=CHUNK_ROWS, artifacts_dir=ARTIFACTS_OUT):
+    """
+    Continue the model in artifacts_dir on the rows of csv_path only.
+
+    Routes/weathers seen for the first time get codes after the existing
+    ones, so every code already in use (prediction tables, cached
+    responses) keeps its meaning.
+    """
+    if not os.path.exists(csv_path):
+        print(f"Error: Dataset not found at {csv_path}")
+        return
+
+    model = joblib.load(os.path.join(artifacts_dir, "model.pkl"))
+    metadata = joblib.load(os.path.join(artifacts_dir, "metadata.pkl"))
+    le_route = joblib.load(os.path.join(artifacts_dir, "le_route.pkl"))
+    le_weather = joblib.load(os.path.join(artifacts_dir, "le_weather.pkl"))
+    quantiles_path = os.path.join(artifacts_dir, QUANTILES_FILE)
+    quantiles = joblib.load(quantiles_path) if os.path.exists(quantiles_path) else None
+    if list(metadata.get("feature_cols", FEATURE_COLS)) != FEATURE_COLS:
+        print(f"Error: {artifacts_dir} was trained on {metadata.get('feature_cols')}, not {FEATURE_COLS}")
+        return
+
+    n_routes, n_weathers = len(le_route.classes_), len(le_weather.classes_)
+    X, y, le_route, le_weather = load_training_data(csv_path, chunk_size, le_route, le_weather)
+    print(
+        f"Continuing {metadata.get('model_name')} on {len(y)} new records "
+        f"({len(le_route.classes_) - n_routes} new routes, {len(le_weather.classes_) - n_weathers} new weathers)"
+    )
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    mae_before = mean_absolute_error(y_test, model.predict(model_input(model, X_test)))
+    model = continue_training(model, model_input(model, X_train), y_train, add_trees)
+    if quantiles is not None:
+        # Keep the interval in step with the point model
+        for quantile_model in quantiles["models"]:
+            continue_training(quantile_model, model_input(quantile_model, X_train), y_train, add_trees)
+    mae_after = mean_absolute_error(y_test, model.predict(model_input(model, X_test)))
+    print(f"MAE on held-out new rows: {mae_before:.2f} -> {mae_after:.2f} min")
+
+    metadata.setdefault("increments", []).append(
+        {
+            "source": os.path.basename(csv_path),
+            "rows": int(len(y)),
+            "added_trees": add_trees,
+            "new_routes": [str(r) for r in le_route.classes_[n_routes:]],
+            "new_weathers": [str(w) for w in le_weather.classes_[n_weathers:]],
+            "mae_before": float(mae_before),
+            "mae_after": float(mae_after),
+        }
+    )
+    # The trees changed, so the old margin no longer fits them
+    calibration = calibrate_interval(model, quantiles, X_test, y_test)
+    metadata["increments"][-1].update(calibration)
+    metadata.update(calibration)
+    save_artifacts(model, metadata, le_route, le_weather, artifacts_dir, quantiles)
 
 
 if __name__ == "__main__":
-    train_model()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the delay model")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_ROWS, help="CSV rows read per chunk")
+    parser.add_argument("--cache-dir", default=DATASET_CACHE_DIR, help="where encoded datasets are cached")
+    parser.add_argument("--no-cache", action="store_true", help="always parse the CSV, don't read or write the cache")
+    parser.add_argument("--preprocess-only", action="store_true", help="build the dataset cache and exit")
+    parser.add_argument("--search", action="store_true", help="pick the model by parallel k-fold CV")
+    parser.add_argument("--folds", type=int, default=5, help="CV folds for --search")
+    parser.add_argument("--workers", type=int, default=None, help="processes for --search (default: all cores)")
+    parser.add_argument("--incremental", metavar="CSV", help="continue the saved model on the new rows in CSV")
+    parser.add_argument("--add-trees", type=int, default=INCREMENT_TREES, help="rounds/trees added by --incremental")
+    args = parser.parse_args()
+    if args.incremental:
+        train_incremental(args.incremental, args.add_trees, args.chunk_size)
+    else:
+        train_model(
+            args.chunk_size,
+            None if args.no_cache else args.cache_dir,
+            args.preprocess_only,
+            search_mode=args.search,
+            folds=args.folds,
+            workers=args.workers,
+        )
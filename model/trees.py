@@ -0,0 +1,306 @@
+"""
+Tree ensembles as flat NumPy arrays, evaluated without sklearn/xgboost.
+
+The trained forest (RandomForest) or booster (XGBoost) is flattened into one
+set of node arrays shared by all trees: feature, threshold, left, right and
+value, plus the root node of every tree. Leaves point to themselves, so a
+batch is evaluated by stepping every (row, tree) pair down max_depth levels
+at once. There are no per-row Python loops and no branching on leaf nodes.
+Batches of DISTINCT_MIN_ROWS or more walk only their distinct rows.
+
+Per call this beats model.predict on single rows and small batches (the
+/predict path). On large batches every extra row still costs n_trees x
+max_depth array steps; bulk callers (/api/predict/batch, /api/forecast,
+score.py) should run with PREDICT_TABLE=1, which answers them from the
+domain table built from these trees.
+
+Comparison follows the source library: XGBoost goes left on x < threshold
+(float32), sklearn on float32(x) <= threshold (float64). A forest averages
+its trees. A booster sums them onto base_score in float32, in tree order,
+as XGBoost does.
+
+    python trees.py [artifacts_dir]            export trees.npz next to model.pkl
+    python trees.py --check [artifacts_dir]    parity against model.predict
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+from compact import atomic_write, calibration_arrays, calibration_metadata, load_npz
+from uncertainty import BoosterQuantiles, interval_model
+
+
+TREES_FILE = "trees.npz"
+# Below this many rows a batch is walked as is; deduplicating would cost more than it saves
+DISTINCT_MIN_ROWS = 64
+
+
+def distinct_rows(features):
+    """
+    -> (distinct rows, inverse) with rows == distinct[inverse]. Serving rows
+    come from a closed domain (24 hours x weathers x routes), so a large
+    batch repeats rows and only the distinct ones need walking.
+    """
+    X = np.ascontiguousarray(features, dtype=np.float64)
+    # One opaque byte string per row: a 1-D unique instead of the much slower axis=0 sort
+    keys = X.view(np.dtype((np.void, X.dtype.itemsize * X.shape[1]))).ravel()
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys.view(np.float64).reshape(-1, X.shape[1]), inverse.reshape(-1)
+
+
+class TreeEnsemble:
+    """Stand-in for the trained model, walking the exported trees in NumPy"""
+
+    def __init__(self, arrays, model_name=None):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.kind = str(arrays["kind"])
+        self.aggregate = str(arrays["aggregate"])
+        self.base_score = float(arrays["base_score"])
+        self.max_depth = int(arrays["max_depth"])
+        # [left, right] per node, so one take() steps every (row, tree) pair
+        self.children = np.column_stack([self.left, self.right]).ravel()
+        self.model_name = model_name
+        self.n_features_in_ = 4
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def leaves(self, features):
+        """(n_rows, n_trees) leaf node index reached by every row in every tree"""
+        X = np.asarray(features).astype(np.float32).astype(np.float64)
+        n_rows = len(X)
+        # Feature-major copy so x[row, feature] is one flat take()
+        columns = np.ascontiguousarray(X.T).ravel()
+        row_offsets = np.arange(n_rows)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            x = columns.take(self.feature.take(nodes) * n_rows + row_offsets)
+            threshold = self.threshold.take(nodes)
+            go_right = ~(x < threshold) if self.kind == "lt" else ~(x <= threshold)
+            nodes = self.children.take(nodes * 2 + go_right)
+        return nodes
+
+    def per_tree(self, features):
+        """(n_rows, n_trees) output of every tree"""
+        return self.value.take(self.leaves(features))
+
+    def predict(self, features):
+        if len(features) >= DISTINCT_MIN_ROWS:
+            rows, inverse = distinct_rows(features)
+            if len(rows) < len(features):
+                return self._predict(rows)[inverse]
+        return self._predict(features)
+
+    def _predict(self, features):
+        values = self.per_tree(features)
+        if self.aggregate == "mean":
+            return values.mean(axis=1)
+        # XGBoost adds tree by tree in float32 onto base_score; cumsum keeps
+        # that order (a pairwise sum can round a .x5 delay the other way)
+        margins = np.empty((len(values), self.n_trees + 1), dtype=np.float32)
+        margins[:, 0] = self.base_score
+        margins[:, 1:] = values
+        return np.cumsum(margins, axis=1, dtype=np.float32)[:, -1]
+
+
+def _depth(left, right, root):
+    depth, frontier = 0, [root]
+    while True:
+        children = [c for n in frontier for c in (left[n], right[n]) if c != n]
+        if not children:
+            return depth
+        depth += 1
+        frontier = children
+
+
+def _pack(trees, kind, aggregate, base_score):
+    """trees: list of (feature, threshold, left, right, value) with -1 for leaf children"""
+    parts = {name: [] for name in ("feature", "threshold", "left", "right", "value")}
+    roots = []
+    offset = 0
+    for feature, threshold, left, right, value in trees:
+        n = len(feature)
+        leaf = left < 0
+        ids = np.arange(n)
+        roots.append(offset)
+        parts["feature"].append(np.where(leaf, 0, feature))
+        parts["threshold"].append(np.where(leaf, 0.0, threshold))
+        parts["left"].append(np.where(leaf, ids, left) + offset)
+        parts["right"].append(np.where(leaf, ids, right) + offset)
+        parts["value"].append(value)
+        offset += n
+
+    arrays = {
+        "feature": np.concatenate(parts["feature"]).astype(np.int32),
+        "threshold": np.concatenate(parts["threshold"]).astype(np.float64),
+        "left": np.concatenate(parts["left"]).astype(np.int32),
+        "right": np.concatenate(parts["right"]).astype(np.int32),
+        "value": np.concatenate(parts["value"]).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "kind": np.asarray(kind),
+        "aggregate": np.asarray(aggregate),
+        "base_score": np.asarray(base_score, dtype=np.float64),
+    }
+    arrays["max_depth"] = np.asarray(
+        max(_depth(arrays["left"], arrays["right"], root) for root in arrays["roots"]),
+        dtype=np.int32,
+    )
+    return arrays
+
+
+def flatten_sklearn_forest(model):
+    trees = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        trees.append(
+            (
+                tree.feature,
+                tree.threshold,
+                tree.children_left,
+                tree.children_right,
+                tree.value[:, 0, 0],
+            )
+        )
+    return _pack(trees, kind="le", aggregate="mean", base_score=0.0)
+
+
+def flatten_xgboost(model):
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+    objective = learner["objective"]["name"]
+    if not objective.startswith("reg:") or objective in ("reg:logistic", "reg:gamma", "reg:tweedie"):
+        raise ValueError(f"unsupported XGBoost objective {objective}")
+
+    gbtree = learner["gradient_booster"]["model"]
+    n_trees = len(gbtree["trees"])
+    # predict() stops at the best iteration of an early-stopped model
+    best_iteration = getattr(model, "best_iteration", None) if model.get_params().get("early_stopping_rounds") else None
+    if best_iteration is not None:
+        n_trees = int(gbtree["iteration_indptr"][best_iteration + 1])
+
+    trees = []
+    for tree in gbtree["trees"][:n_trees]:
+        left = np.asarray(tree["left_children"], dtype=np.int64)
+        # Leaves keep their weight in split_conditions
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+        trees.append(
+            (
+                np.asarray(tree["split_indices"], dtype=np.int64),
+                conditions,
+                left,
+                np.asarray(tree["right_children"], dtype=np.int64),
+                conditions,
+            )
+        )
+    base_score = float(learner["learner_model_param"]["base_score"].strip("[]").split(",")[0])
+    return _pack(trees, kind="lt", aggregate="sum", base_score=base_score)
+
+
+def flatten_model(model):
+    if hasattr(model, "get_booster"):
+        return flatten_xgboost(model)
+    if hasattr(model, "estimators_"):
+        return flatten_sklearn_forest(model)
+    raise TypeError(f"cannot flatten {type(model).__name__}")
+
+
+def export_trees(artifacts_dir, out_path=None):
+    """Flatten model.pkl and write trees.npz (with the encoders' classes) next to it"""
+    from registry import load_artifacts
+
+    artifacts = load_artifacts(artifacts_dir)
+    if artifacts.model is None or artifacts.le_route is None or artifacts.le_weather is None:
+        raise FileNotFoundError(f"model.pkl and both encoders are required in {artifacts_dir}")
+
+    arrays = flatten_model(artifacts.model)
+    if artifacts.quantiles is not None:
+        # The quantile boosters (uncertainty.py) go in the same file, prefixed q0_, q1_, ...
+        arrays["quantile_alphas"] = np.asarray(artifacts.quantiles["alphas"], dtype=np.float64)
+        for i, model in enumerate(artifacts.quantiles["models"]):
+            arrays.update({f"q{i}_{name}": value for name, value in flatten_model(model).items()})
+    if artifacts.metadata.get("interval_margin") is not None:
+        arrays["interval_margin"] = np.asarray(artifacts.metadata["interval_margin"], dtype=np.float64)
+    arrays.update(calibration_arrays(artifacts.confidence_calibration))
+    out_path = out_path or os.path.join(artifacts_dir, TREES_FILE)
+    with atomic_write(out_path) as f:
+        np.savez(
+            f,
+            route_classes=artifacts.route_encoder.classes_,
+            weather_classes=artifacts.weather_encoder.classes_,
+            feature_cols=np.asarray(artifacts.metadata.get("feature_cols", []), dtype=str),
+            model_name=np.asarray(artifacts.metadata.get("model_name", ""), dtype=str),
+            source_version=np.asarray(artifacts.version or "", dtype=str),
+            **arrays,
+        )
+    return out_path
+
+
+def load_trees(path, mmap=False):
+    """-> (TreeEnsemble, route_classes, weather_classes, metadata, interval model or None)"""
+    data = load_npz(path, mmap=mmap)
+    model_name = str(data["model_name"])
+    metadata = {
+        "model_name": model_name,
+        "feature_cols": data["feature_cols"].tolist(),
+        "source_version": str(data["source_version"]),
+        "format": "trees",
+        **calibration_metadata(data),
+    }
+    ensemble = TreeEnsemble(data, model_name)
+    margin = float(data["interval_margin"]) if "interval_margin" in data else None
+    if "quantile_alphas" in data:
+        alphas = data["quantile_alphas"]
+        models = [
+            TreeEnsemble({name[len(f"q{i}_"):]: value for name, value in data.items() if name.startswith(f"q{i}_")})
+            for i in range(len(alphas))
+        ]
+        interval = BoosterQuantiles(models, alphas, margin or 0.0)
+    else:
+        interval = interval_model(ensemble, margin=margin)
+    return ensemble, data["route_classes"], data["weather_classes"], metadata, interval
+
+
+def check_parity(artifacts_dir, rtol=1e-6, atol=1e-6):
+    """
+    Compare TreeEnsemble with model.predict on the whole serving domain,
+    plus out-of-range hours and codes. Returns True when they match within
+    rtol/atol (the max absolute difference is printed).
+    """
+    from prediction_table import domain_grid
+    from registry import load_artifacts
+
+    artifacts = load_artifacts(artifacts_dir)
+    ensemble = TreeEnsemble(flatten_model(artifacts.model))
+    grid = domain_grid(len(artifacts.weather_encoder), len(artifacts.route_encoder))
+    outside = grid.copy()
+    outside[:, 0] += 24
+    outside[:, 2:] += 3
+    grid = np.vstack([grid, outside])
+
+    expected = np.asarray(artifacts.model.predict(grid), dtype=np.float64)
+    actual = ensemble.predict(grid)
+    diff = np.abs(expected - actual)
+    ok = np.allclose(actual, expected, rtol=rtol, atol=atol)
+    print(
+        f"{'✅' if ok else '❌'} {ensemble.n_trees} trees, {len(grid)} rows: "
+        f"max |diff| {diff.max():.3g} (mean {diff.mean():.3g})"
+    )
+    return ok
+
+
+if __name__ == "__main__":
+    from registry import ARTIFACTS_DIR
+
+    args = sys.argv[1:]
+    if args and args[0] == "--check":
+        sys.exit(0 if check_parity(args[1] if len(args) > 1 else ARTIFACTS_DIR) else 1)
+    path = export_trees(args[0] if args else ARTIFACTS_DIR)
+    print(f"Tree arrays written to {path}")
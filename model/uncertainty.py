@@ -0,0 +1,205 @@
+"""
+Per-prediction uncertainty, replacing the fixed confidence numbers.
+
+An interval model returns the 10th and 90th percentile of the delay for
+every row of a batch in one vectorized call:
+
+* RandomForest: the spread of its trees. The forest is flattened once
+  (trees.py). per_tree() evaluates all trees for the whole batch, then
+  np.quantile runs across the tree axis.
+* XGBoost: a booster's trees are additive, so they have no spread to read.
+  train.py fits two boosters with the quantile objective
+  (reg:quantileerror, alpha 0.1 and 0.9) and saves them as quantiles.pkl.
+
+The spread of per-tree means is much narrower than the spread of actual
+delays, so the raw bounds are widened by a margin calibrated on held-out
+trips (calibrate_margin(), conformalized quantiles): the smallest widening
+that puts 80% of those delays inside the interval. train.py stores it as
+metadata["interval_margin"]. A forest without a margin gets no interval
+model at all and the servers keep the fixed confidence. The boosters are
+calibrated the same way, their margin is usually close to 0.
+
+The confidence is the chance that the actual delay lands within tolerance
+of the point prediction. The tolerance is TOLERANCE_MINUTES or
+TOLERANCE_FRACTION of the prediction, whichever is larger. Reading the
+interval as a normal distribution gives a raw score, which still
+overstates that chance. calibrate_confidence() maps raw scores to the hit
+rate actually observed on held-out trips with similar scores; train.py
+stores the map as metadata["confidence_calibration"]. Artifacts trained
+before it get the raw score. The result is reported as 0-100, like the
+old fixed value. It depends only on the feature row, so it is cached and
+tabulated along with the delay.
+"""
+import numpy as np
+
+
+QUANTILES_FILE = "quantiles.pkl"
+ALPHAS = (0.1, 0.9)
+
+TOLERANCE_MINUTES = 5.0
+TOLERANCE_FRACTION = 0.25
+# The 10-90 interval of a normal distribution is 2 * Z_90 standard deviations wide
+Z_90 = 1.2815515655446004
+# Held-out trips per bin of the confidence calibration, and at most this many bins
+CALIBRATION_BIN_ROWS = 50
+CALIBRATION_MAX_BINS = 20
+
+
+def widen(bounds, margin):
+    """[low, high] -> [low - margin, high + margin]"""
+    if margin:
+        bounds[:, 0] -= margin
+        bounds[:, -1] += margin
+    return bounds
+
+
+class ForestQuantiles:
+    """Quantiles across the trees of an averaged forest (a mean-aggregated TreeEnsemble), widened by margin"""
+
+    def __init__(self, ensemble, alphas=ALPHAS, margin=0.0):
+        self.ensemble = ensemble
+        self.alphas = np.asarray(alphas, dtype=np.float64)
+        self.margin = float(margin)
+
+    def predict(self, features):
+        """(n_rows, n_alphas) delay quantiles"""
+        from trees import DISTINCT_MIN_ROWS, distinct_rows
+
+        if len(features) >= DISTINCT_MIN_ROWS:
+            # per_tree() is (n_rows x n_trees): only walk the distinct rows, as TreeEnsemble.predict does
+            rows, inverse = distinct_rows(features)
+            if len(rows) < len(features):
+                return self.predict(rows)[inverse]
+        return widen(np.quantile(self.ensemble.per_tree(features), self.alphas, axis=1).T, self.margin)
+
+
+class BoosterQuantiles:
+    """One quantile-objective model per alpha (XGBRegressor, or its exported TreeEnsemble), widened by margin"""
+
+    def __init__(self, models, alphas=ALPHAS, margin=0.0):
+        self.models = list(models)
+        self.alphas = np.asarray(alphas, dtype=np.float64)
+        self.margin = float(margin)
+
+    def predict(self, features):
+        bounds = np.column_stack([np.asarray(m.predict(features), dtype=np.float64) for m in self.models])
+        # Separately fitted quantiles can cross on sparse rows
+        return widen(np.sort(bounds, axis=1), self.margin)
+
+
+def fit_quantile_boosters(params, X, y, alphas=ALPHAS):
+    """XGBoost regressors with the quantile objective, one per alpha (same params as the point model)"""
+    import xgboost as xgb
+
+    params = {k: v for k, v in params.items() if k not in ("objective", "quantile_alpha", "early_stopping_rounds")}
+    models = []
+    for alpha in alphas:
+        model = xgb.XGBRegressor(objective="reg:quantileerror", quantile_alpha=alpha, **params)
+        model.fit(X, y)
+        models.append(model)
+    return {"alphas": list(alphas), "models": models}
+
+
+def interval_model(model, quantiles=None, margin=None):
+    """
+    The interval model for a point model, or None when it has no source of
+    spread. margin is metadata["interval_margin"]; a forest needs one, the
+    tree spread alone is no delay interval.
+    """
+    from trees import TreeEnsemble, flatten_sklearn_forest
+
+    if quantiles is not None:
+        return BoosterQuantiles(quantiles["models"], quantiles["alphas"], margin or 0.0)
+    if margin is None:
+        return None
+    if isinstance(model, TreeEnsemble):
+        return ForestQuantiles(model, margin=margin) if model.aggregate == "mean" else None
+    if hasattr(model, "estimators_"):
+        return ForestQuantiles(TreeEnsemble(flatten_sklearn_forest(model)), margin=margin)
+    return None
+
+
+def calibrate_margin(bounds, y, alphas=ALPHAS):
+    """
+    Smallest widening of [low, high] that covers the target share of the
+    held-out delays y (split conformal, so with the finite-sample correction)
+    """
+    y = np.asarray(y, dtype=np.float64)
+    # How far each delay lies outside its interval (negative inside)
+    scores = np.maximum(bounds[:, 0] - y, y - bounds[:, -1])
+    target = alphas[-1] - alphas[0]
+    level = min(1.0, np.ceil((len(y) + 1) * target) / len(y))
+    return max(0.0, float(np.quantile(scores, level, method="higher")))
+
+
+def _erf(x):
+    # Abramowitz & Stegun 7.1.26, |error| < 1.5e-7; NumPy has no erf and scipy is not a serving dependency
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1.0 - poly * np.exp(-x * x))
+
+
+def within_tolerance(delays, actual):
+    """True where the actual delay is within tolerance of the predicted one"""
+    delays = np.asarray(delays, dtype=np.float64)
+    tolerance = np.maximum(TOLERANCE_MINUTES, TOLERANCE_FRACTION * np.abs(delays))
+    return np.abs(np.asarray(actual, dtype=np.float64) - delays) <= tolerance
+
+
+def tolerance_probability(delays, bounds):
+    """
+    Raw 0-1 score per row: P(|actual - delay| <= tolerance) with the delay
+    distribution taken as normal over the [q10, q90] bounds
+    """
+    delays = np.asarray(delays, dtype=np.float64)
+    bounds = np.asarray(bounds, dtype=np.float64)
+    low, high = bounds[:, 0], bounds[:, -1]
+    tolerance = np.maximum(TOLERANCE_MINUTES, TOLERANCE_FRACTION * np.abs(delays))
+    center = (low + high) / 2
+    scale = (high - low) / (2 * Z_90) * np.sqrt(2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        upper = (delays + tolerance - center) / scale
+        lower = (delays - tolerance - center) / scale
+        p = 0.5 * (_erf(upper) - _erf(lower))
+    # Zero-width interval: all trees / quantiles agree
+    p = np.where(scale > 0, p, np.abs(delays - center) <= tolerance)
+    return np.clip(p, 0.0, 1.0)
+
+
+def calibrate_confidence(delays, bounds, actual):
+    """
+    Raw score -> observed hit rate on held-out trips, as {"scores", "rates"}
+    for np.interp. Trips are binned by raw score (CALIBRATION_BIN_ROWS per
+    bin), and neighbouring bins are pooled until the rate never falls as the
+    score rises (pool adjacent violators).
+    """
+    raw = tolerance_probability(delays, bounds)
+    hits = within_tolerance(delays, actual).astype(np.float64)
+    order = np.argsort(raw, kind="stable")
+    n_bins = int(np.clip(len(raw) // CALIBRATION_BIN_ROWS, 1, CALIBRATION_MAX_BINS))
+    blocks = []
+    for rows in np.array_split(order, n_bins):
+        # [score sum, hit count, rows]; pool into the previous block while the rate drops
+        block = [raw[rows].sum(), hits[rows].sum(), len(rows)]
+        while blocks and blocks[-1][1] / blocks[-1][2] > block[1] / block[2]:
+            previous = blocks.pop()
+            block = [previous[i] + block[i] for i in range(3)]
+        blocks.append(block)
+    return {
+        "scores": [float(total / n) for total, _, n in blocks],
+        "rates": [float(hit / n) for _, hit, n in blocks],
+    }
+
+
+def confidence(delays, bounds, calibration=None):
+    """
+    0-100 per row: tolerance_probability(), mapped through the held-out
+    hit rates of calibrate_confidence() when the artifacts have them
+    """
+    p = tolerance_probability(delays, bounds)
+    if calibration is not None:
+        p = np.interp(p, calibration["scores"], calibration["rates"])
+    return np.rint(p * 100).astype(np.int64)